@@ -21,25 +21,26 @@ bl_info = {
     "description": "Aligns selection to last annotation grease pencil stroke. Default hotkey is [ALT + double-click RIGHT MOUSE].",
     "author": "Bjørnar Frøyse",
     "version": (1, 2, 3),
-    "blender": (2, 80, 0),
+    "blender": (2, 81, 0),
     "location": "Shortcut Only",
     "category": "Mesh"
 }
 
+import sys
+
 import bpy
-from bpy_extras import view3d_utils
-import bmesh
-import mathutils
-from bpy.props import FloatProperty, BoolProperty
+from bpy.app.handlers import persistent
+from bpy.props import FloatProperty, BoolProperty, EnumProperty, IntProperty, StringProperty
 from bpy.types import Operator
-import math
 
-# TODO: Implement surface snap/projection (for retopo).
+# Only the operators and preferences are defined here. The engines live in align, which
+# (with NumPy and everything else it needs) is imported by the operators on their first run.
+
 # TODO: Option to lock axis?
-# TODO: More flexible "projection"? Currently only vertical & horizontal. Works in most cases, but can easily be a bit wonky.
-# TODO: Make it work with the mesh.use_mirror_x setting.
-# TODO: Proportional editing
-# TODO: Support for bones (pose mode)
+
+# Shortcut settings changed: the keymap items are made again from them.
+def update_keymap(self, context):
+    bind_keymap(self)
 
 # Preferences for the addon (Displayed "inside" the addon in user preferences)
 class PREFS_bear_align_to_gpencil(bpy.types.AddonPreferences):
@@ -53,7 +54,8 @@ class PREFS_bear_align_to_gpencil(bpy.types.AddonPreferences):
     use_default_shortcut: BoolProperty(
             name = "Use Default Shortcut",
             description = "Use default shortcut: mouse double-click + modifier",
-            default = True)
+            default = True,
+            update = update_keymap)
 
     mouse_click : bpy.props.EnumProperty(
         name="Mouse button", description="Double click on right/left/middle mouse button in combination with a modifier to trigger alignement",
@@ -62,35 +64,50 @@ class PREFS_bear_align_to_gpencil(bpy.types.AddonPreferences):
             ('RIGHTMOUSE', 'double Right click', 'Use double click on Right mouse button', 'MOUSE_RMB', 0),
             ('LEFTMOUSE', 'double Left click', 'Use double click on Left mouse button', 'MOUSE_LMB', 1),
             ('MIDDLEMOUSE', 'double Mid click', 'Use double click on Mid mouse button', 'MOUSE_MMB', 2),
-            ))
+            ),
+        update=update_keymap)
     
     use_shift: BoolProperty(
             name = "combine with shift",
             description = "add shift combined with double click to trigger alignement",
-            default = False)
+            default = False,
+            update = update_keymap)
 
     use_alt: BoolProperty(
             name = "combine with alt",
             description = "add alt combined with double click to trigger alignement (default)",
-            default = True)
+            default = True,
+            update = update_keymap)
 
     use_ctrl: BoolProperty(
             name = "combine with ctrl",
             description = "add ctrl combined with double click to trigger alignement",
+            default = False,
+            update = update_keymap)
+
+    profile_runs: BoolProperty(
+            name = "Profile Runs",
+            description = "Time every stage of each align run. The total goes to the info bar, the full breakdown to the system console",
+            default = False)
+
+    use_cprofile: BoolProperty(
+            name = "Use cProfile",
+            description = "Also run the Python profiler during each profiled run, and print its slowest functions to the system console. Slows runs down",
             default = False)
 
     def draw(self, context):
 
         self.layout.prop(self, "clear_strokes")
-        if(self.clear_strokes):
-            self.layout.label(text="'clear strokes' option will currently make the influence slider stop working", icon="ERROR")
+
+        row = self.layout.row()
+        row.prop(self, "profile_runs")
+        sub = row.row()
+        sub.active = self.profile_runs
+        sub.prop(self, "use_cprofile")
 
         self.layout.prop(self, "use_default_shortcut", text='Bind shortcuts')
 
         if(self.use_default_shortcut):
-            self.row = self.layout.row()
-            self.row.label(text="After changes, use the Bind/Rebind button")#icon=""
-            self.row.operator("prefs.bear_rebind_shortcut", text='Bind/Rebind shortcuts', icon='FILE_REFRESH')#EVENT_SPACEKEY
             self.layout.prop(self, "mouse_click",text='')
             self.layout.prop(self, "use_alt", text='+ Alt')
             self.layout.prop(self, "use_shift", text='+ Shift')
@@ -99,34 +116,15 @@ class PREFS_bear_align_to_gpencil(bpy.types.AddonPreferences):
 
         else:
             self.layout.label(text="No hotkey has been set automatically. Following operators needs to be set manually:", icon="ERROR")
-            self.layout.label(text="mesh.bear_align_selection_to_gpencil")
-            self.layout.label(text="object.bear_align_selection_to_gpencil")
-            self.layout.label(text="uv.bear_align_selection_to_gpencil")
-            self.layout.label(text="armature.bear_align_selection_to_gpencil")
-            self.layout.label(text="curve.bear_align_selection_to_gpencil")
-
-        if self.use_default_shortcut:
-            bind_keymap()
-        else:
-            unbind_keymap()
+            for _, idname in KEYMAP_ITEMS:
+                self.layout.label(text=idname)
+            self.layout.label(text="mesh.bear_live_align_to_gpencil")
 
-class PREFS_OT_rebind(Operator):
-    """Rebind shortchuts for align to gp annotation"""
-    bl_idname = "prefs.bear_rebind_shortcut"
-    bl_label = "Rebind bear shortcut"
-    bl_options = {'REGISTER', 'INTERNAL'}#internal mask it from search bar
-
-    def execute(self, context):
-        unbind_keymap()
-        bind_keymap()
-        return{'FINISHED'}
-
-class OBJECT_OT_bear_align_to_gpencil(Operator):
-    """Aligns selected objects to grease pencil stroke"""
-    bl_idname = "object.bear_align_selection_to_gpencil"
-    bl_label = "Align objects to Grease Pencil"
-    bl_options = {'REGISTER', 'UNDO'}
+# Seconds between two live align updates.
+LIVE_ALIGN_INTERVAL = 1.0 / 30.0
 
+# Properties shared by all the align operators.
+class AlignToGPencilProperties:
     influence: FloatProperty(
             name="Influence",
             description="Influence",
@@ -134,494 +132,363 @@ class OBJECT_OT_bear_align_to_gpencil(Operator):
             default=1.0,
             )
 
-    def execute(self, context):
-        # Object mode
-        if bpy.context.mode == 'OBJECT':
-            align_objects(context, self.influence)
-            return {'FINISHED'}
+    projection: EnumProperty(
+            name="Projection",
+            description="How selected elements find their place on the stroke",
+            default='AXIS',
+            items=(
+                ('AXIS', "Look Up/Side", "Search along the stroke's longest axis. Fast, but can be wonky on curly strokes"),
+                ('NEAREST', "Nearest Point", "Snap to the closest point on the stroke. Works with any stroke shape"),
+                ))
+
+    stroke_source: EnumProperty(
+            name="Strokes",
+            description="Which annotation strokes to align to",
+            default='LAST',
+            items=(
+                ('LAST', "Last Stroke", "Align to the last stroke drawn"),
+                ('ALL', "All Strokes", "Align each element to the nearest of all strokes on the visible annotation layers"),
+                ))
+
+    # Stroke clean-up, in screen pixels. See stroke_preprocess.
+    simplify_tolerance: FloatProperty(
+            name="Simplify",
+            description="Drop stroke points closer than this many pixels to the simplified stroke (0 to keep all)",
+            min=0.0, soft_max=10.0,
+            default=0.0,
+            )
+
+    resample_spacing: FloatProperty(
+            name="Resample Spacing",
+            description="Resample the stroke with evenly spaced points this many pixels apart (0 to keep the drawn spacing)",
+            min=0.0, soft_max=50.0,
+            default=0.0,
+            )
+
+    smooth_iterations: IntProperty(
+            name="Smooth",
+            description="Smoothing passes over the stroke, to take out jitter",
+            min=0, soft_max=20,
+            default=0,
+            )
+
+    max_stroke_points: IntProperty(
+            name="Point Budget",
+            description="Most points the stroke is solved with. Longer strokes are resampled down to this (0 for no limit)",
+            min=0,
+            default=2048,
+            )
 
-        print("No valid cases found. Try again with another selection!")
-        return{'FINISHED'}
+    # Keys of the strokes used by this run, one per stroke source, so redo can find them
+    # again after they were cleared, and switching the source in the redo panel reads its own.
+    stroke_key: StringProperty(options={'HIDDEN', 'SKIP_SAVE'})
+    all_strokes_key: StringProperty(options={'HIDDEN', 'SKIP_SAVE'})
+
+# Property of the operators whose selection comes in chains: edge loops, bone chains and splines.
+class DistributionProperties:
+    distribution: EnumProperty(
+            name="Distribution",
+            description="Where along the stroke the selected elements go",
+            default='SNAP',
+            items=(
+                ('SNAP', "Snap", "Each element goes to its own place on the stroke (see Projection)"),
+                ('EVEN', "Even Spacing", "Spread each chain of elements (edge loop, bone chain, spline) over the last stroke, evenly spaced"),
+                ('PROPORTIONAL', "Proportional Spacing", "Spread each chain of elements over the last stroke, keeping their relative spacing"),
+                ))
+
+class OBJECT_OT_bear_align_to_gpencil(AlignToGPencilProperties, Operator):
+    """Aligns selected objects to grease pencil stroke"""
+    bl_idname = "object.bear_align_selection_to_gpencil"
+    bl_label = "Align objects to Grease Pencil"
+    bl_options = {'REGISTER', 'UNDO'}
 
-class UV_OT_bear_align_to_gpencil(Operator):
+    insert_keyframes: BoolProperty(
+            name="Insert Keyframes",
+            description="Key the new object locations on the current frame (always done with auto keying on)",
+            default=False,
+            )
+
+    def execute(self, context):
+        from . import align, profiling
+        with profiling.run(self, context):
+            # Object mode
+            if bpy.context.mode == 'OBJECT':
+                solver = align.solver_for_operator(self, context)
+                if solver is None:
+                    self.report({'WARNING'}, "No annotation stroke found in view")
+                    return {'CANCELLED'}
+                insert_keyframes = self.insert_keyframes or context.scene.tool_settings.use_keyframe_insert_auto
+                align.align_objects(context, self.influence, solver, insert_keyframes)
+                return {'FINISHED'}
+
+            self.report({'WARNING'}, "No valid cases found. Try again with another selection!")
+            return{'FINISHED'}
+
+class UV_OT_bear_align_to_gpencil(AlignToGPencilProperties, Operator):
     """Aligns UV selection to gpencil stroke"""
     """Aligns selection to grease pencil stroke"""
     bl_idname = "uv.bear_align_selection_to_gpencil"
     bl_label = "Align UV vertices to Grease Pencil"
     bl_options = {'REGISTER', 'UNDO'}
 
-    influence: FloatProperty(
-            name="Influence",
-            description="Influence",
-            min=0.0, max=1.0,
-            default=1.0,
-            )
-
     def execute(self, context):
-        align_uvs(context, self.influence)
-        return {'FINISHED'}
-
-
-class MESH_OT_bear_align_to_gpencil(Operator):
+        from . import align, profiling
+        with profiling.run(self, context):
+            # UV Editor, mesh edit mode
+            if context.mode == 'EDIT_MESH' and context.space_data.type == 'IMAGE_EDITOR':
+                # Strokes drawn in the UV Editor belong to the editor, and are stored in UV space.
+                view = align.view_projection.UVProjection.from_context(context)
+                solver = align.solver_for_operator(self, context, view, context.space_data.grease_pencil)
+                if solver is None:
+                    self.report({'WARNING'}, "No annotation stroke found in view")
+                    return {'CANCELLED'}
+                align.align_uvs(context, self.influence, solver)
+                return {'FINISHED'}
+
+            self.report({'WARNING'}, "No valid cases found. Try again with another selection!")
+            return{'FINISHED'}
+
+
+class MESH_OT_bear_align_to_gpencil(AlignToGPencilProperties, DistributionProperties, Operator):
     """Aligns selection to grease pencil stroke"""
     bl_idname = "mesh.bear_align_selection_to_gpencil"
     bl_label = "Align Verts to Grease Pencil"
     bl_options = {'REGISTER', 'UNDO'}
 
-    influence: FloatProperty(
-            name="Influence",
-            description="Influence",
-            min=0.0, max=1.0,
-            default=1.0,
+    bulk_io: BoolProperty(
+            name="Bulk Read",
+            description="Read the selection and coordinates as arrays from the mesh data instead of vertex by vertex. Faster on heavy meshes",
+            default=True,
             )
 
-    def execute(self, context):
-        # Edit mode (vertices)
-        if bpy.context.active_object.type == 'MESH' and bpy.context.active_object.data.is_editmode:
-            align_vertices(context, self.influence)
-            return {'FINISHED'}
-
-        print("No valid cases found. Try again with another selection!")
-        return{'FINISHED'}
+    snap_to_surface: BoolProperty(
+            name="Snap to Surface",
+            description="Cast aligned vertices from their new screen position onto the visible meshes that are not being edited (for retopo)",
+            default=False,
+            )
 
-class CURVE_OT_bear_align_to_gpencil(Operator):
+    def execute(self, context):
+        from . import align, profiling
+        with profiling.run(self, context):
+            # Edit mode (vertices)
+            if bpy.context.active_object.type == 'MESH' and bpy.context.active_object.data.is_editmode:
+                solver = align.solver_for_operator(self, context)
+                if solver is None:
+                    self.report({'WARNING'}, "No annotation stroke found in view")
+                    return {'CANCELLED'}
+                proportional_settings = align.proportional.ProportionalSettings.from_context(context)
+                align.align_vertices(context, self.influence, solver, self.bulk_io, self.snap_to_surface, proportional_settings, self.distribution)
+                return {'FINISHED'}
+
+            self.report({'WARNING'}, "No valid cases found. Try again with another selection!")
+            return{'FINISHED'}
+
+class CURVE_OT_bear_align_to_gpencil(AlignToGPencilProperties, DistributionProperties, Operator):
     """Aligns selection to grease pencil stroke"""
     bl_idname = "curve.bear_align_selection_to_gpencil"
     bl_label = "Align curve points to Grease Pencil"
     bl_options = {'REGISTER', 'UNDO'}
 
-    influence: FloatProperty(
-            name="Influence",
-            description="Influence",
-            min=0.0, max=1.0,
-            default=1.0,
-            )
+    handle_mode: EnumProperty(
+            name="Handles",
+            description="What happens to the handles of aligned Bezier points",
+            default='TANGENT',
+            items=(
+                ('TANGENT', "Follow Stroke", "Lay the handles along the stroke. Auto and vector handles become aligned"),
+                ('KEEP', "Keep", "Move the handles along with their point, keeping the handle types"),
+                ))
 
     def execute(self, context):
-        # Curves
-        if bpy.context.active_object.type == 'CURVE' and bpy.context.active_object.data.is_editmode:
-            align_curves(context, self.influence)
-            return {'FINISHED'}
-
-        print("No valid cases found. Try again with another selection!")
-        return{'FINISHED'}
-
-class ARMATURE_OT_bear_align_to_gpencil(Operator):
+        from . import align, profiling
+        with profiling.run(self, context):
+            # Curves
+            if bpy.context.active_object.type == 'CURVE' and bpy.context.active_object.data.is_editmode:
+                solver = align.solver_for_operator(self, context)
+                if solver is None:
+                    self.report({'WARNING'}, "No annotation stroke found in view")
+                    return {'CANCELLED'}
+                align.align_curves(context, self.influence, solver, self.handle_mode, self.distribution)
+                return {'FINISHED'}
+
+            self.report({'WARNING'}, "No valid cases found. Try again with another selection!")
+            return{'FINISHED'}
+
+class ARMATURE_OT_bear_align_to_gpencil(AlignToGPencilProperties, DistributionProperties, Operator):
     """Aligns selection to grease pencil stroke"""
     bl_idname = "armature.bear_align_selection_to_gpencil"
     bl_label = "Align armature (edit) bones points to Grease Pencil"
     bl_options = {'REGISTER', 'UNDO'}
 
-    influence: FloatProperty(
-            name="Influence",
-            description="Influence",
-            min=0.0, max=1.0,
-            default=1.0,
-            )
-
     def execute(self, context):
-        # Bone edit mode
-        if bpy.context.active_object.type == 'ARMATURE' and bpy.context.active_object.data.is_editmode:
-            align_bones_editmode(context, self.influence)
-            return {'FINISHED'}
-
-        print("No valid cases found. Try again with another selection!")
-        return{'FINISHED'}
+        from . import align, profiling
+        with profiling.run(self, context):
+            # Bone edit mode
+            if bpy.context.active_object.type == 'ARMATURE' and bpy.context.active_object.data.is_editmode:
+                solver = align.solver_for_operator(self, context)
+                if solver is None:
+                    self.report({'WARNING'}, "No annotation stroke found in view")
+                    return {'CANCELLED'}
+                align.align_bones_editmode(context, self.influence, solver, self.distribution)
+                return {'FINISHED'}
+
+            self.report({'WARNING'}, "No valid cases found. Try again with another selection!")
+            return{'FINISHED'}
 
     # @classmethod
     # def poll(cls, context):
-    #     return check_if_any_gp_exists(context)
-
-def align_bones_editmode(context, influence):
-    obj = bpy.context.edit_object
-    bo = obj.data.edit_bones
-
-    selected_bones = [bone for bone in bo if bone.select]
-
-    bone_heads_3d = [bone.head for bone in selected_bones]
-    bone_heads_2d = vectors_to_screenpos(context, bone_heads_3d, obj.matrix_world)
-
-    bone_tails_3d = [bone.tail for bone in selected_bones]
-    bone_tails_2d = vectors_to_screenpos(context, bone_tails_3d, obj.matrix_world)
-
-    stroke = gpencil_to_screenpos(context)
-    
-    for i, bone in enumerate(selected_bones):
-        nearest_point_for_head = get_nearest_interpolated_point_on_stroke(bone_heads_2d[i], stroke, context)
-        newcoord_for_head = obj.matrix_world.inverted() @ region_to_location(nearest_point_for_head, obj.matrix_world @ bone.head)
-        bone.head = bone.head.lerp(newcoord_for_head, influence)
-
-        nearest_point_for_tail = get_nearest_interpolated_point_on_stroke(bone_tails_2d[i], stroke, context)
-        newcoord_for_tail = obj.matrix_world.inverted() @ region_to_location(nearest_point_for_tail, obj.matrix_world @ bone.tail)
-        bone.tail = bone.tail.lerp(newcoord_for_tail, influence)
-
-
-def align_vertices(context, influence):
-    # Object currently in edit mode.
-    obj = bpy.context.edit_object
-    # Object's mesh datablock.
-    me = obj.data
-    # Convert mesh data to bmesh.
-    bm = bmesh.from_edit_mesh(me)
-
-    # Get all selected vertices (in their local space).
-    selected_verts = [v for v in bm.verts if v.select]
-
-    verts_local_3d = [v.co for v in selected_verts]
-
-    # Convert selected vertices' positions to 2D screen space.
-    # IMPORTANT: Multiply vertex coordinates with the world matrix to get their WORLD position, not local position.
-    verts_world_2d = vectors_to_screenpos(context, verts_local_3d, obj.matrix_world)
-
-    stroke = gpencil_to_screenpos(context)
-
-    # For each vert, look up or to the side and find the nearest interpolated gpencil point for this vertex.
-    for i, v in enumerate(selected_verts):
-        nearest_point = get_nearest_interpolated_point_on_stroke(verts_world_2d[i], stroke, context)
-        # Get new vertex coordinate by converting from 2D screen space to 3D world space. Must multiply depth coordinate
-        # with world matrix and then final result by INVERTED world matrix to get a correct final value.
-        newcoord = obj.matrix_world.inverted() @ region_to_location(nearest_point, obj.matrix_world @ v.co)
-        # Apply the final position using an influence slider.
-        v.co = v.co.lerp(newcoord, influence)
-
-    # Recalculate mesh normals (so lighting looks right).
-    for edge in bm.edges:
-        edge.normal_update()
-
-    # Push bmesh changes back to the actual mesh datablock.
-    bmesh.update_edit_mesh(me, True)
-
-
-def align_curves(context, influence):
-
-    print("Aligning curves...\n")
-    # Object currently in edit mode.
-    obj = bpy.context.edit_object
-
-    splines = bpy.context.active_object.data.splines
-
-    spline_is_bezier = False
-
-    if len(splines[0].bezier_points) > 0:
-        spline_is_bezier = True
-
-    # For each vert, look up or to the side and find the nearest interpolated gpencil point for this vertex.
-    if not spline_is_bezier:
-        selected_points = []
-        for spline in splines:
-            for point in spline.points:
-               if point.select:
-                   selected_points.append(point)
-
-        points_local_3d = [p.co for p in selected_points]
-        points_world_2d = vectors_to_screenpos(context, points_local_3d, obj.matrix_world)
-
-        stroke = gpencil_to_screenpos(context)
-
-        for i, p in enumerate(selected_points):
-            nearest_point = get_nearest_interpolated_point_on_stroke(points_world_2d[i], stroke, context)
-            # Get new vertex coordinate by converting from 2D screen space to 3D world space. Must multiply depth coordinate
-            # with world matrix and then final result by INVERTED world matrix to get a correct final value.
-            newcoord = obj.matrix_world.inverted() @ region_to_location(nearest_point, obj.matrix_world @ p.co)
-            # Apply the final position using an influence slider.
-
-            newcoord = newcoord.to_4d()
-            p.co = p.co.lerp(newcoord, influence)
-
-    if spline_is_bezier:
-        selected_bezier_points = []
-        for spline in splines:
-            for point in spline.bezier_points:
-               if point.select_control_point:
-                   selected_bezier_points.append(point)
-
-        bezier_points_local_3d = [p.co for p in selected_bezier_points]
-        bezier_points_world_2d = vectors_to_screenpos(context, bezier_points_local_3d, obj.matrix_world)
-
-        for i, p in enumerate(selected_bezier_points):
-            if p.handle_left_type == 'FREE' or p.handle_left_type == 'ALIGNED' or p.handle_right_type == 'FREE' or p.handle_right_type == 'ALIGNED':
-                print("Supported handle modes: 'VECTOR', 'AUTO'. Please convert. Sorry!")
-                return{'CANCELLED'}
-
-        stroke = gpencil_to_screenpos(context)
-
-        for i, p in enumerate(selected_bezier_points):
-            nearest_point = get_nearest_interpolated_point_on_stroke(bezier_points_world_2d[i], stroke, context)
-            newcoord = obj.matrix_world.inverted() @ region_to_location(nearest_point, obj.matrix_world @ p.co)
-
-            p.co = p.co.lerp(newcoord.to_4d(), influence)
-            p.handle_left = obj.matrix_world.inverted() @ region_to_location(get_nearest_interpolated_point_on_stroke(p.handle_left, stroke, context), obj.matrix_world @ p.handle_left) 
-            p.handle_right = obj.matrix_world.inverted() @ region_to_location(get_nearest_interpolated_point_on_stroke(p.handle_right, stroke, context), obj.matrix_world @ p.handle_right) 
-
-
-def align_objects(context, influence):
-    selected_objs = bpy.context.selected_objects
-
-    stroke = gpencil_to_screenpos(context)
-
-    for i, obj in enumerate(selected_objs):
-        obj_loc_2d = vectors_to_screenpos(context, obj.location, obj.matrix_world @ obj.matrix_world.inverted())
-        nearest_point = get_nearest_interpolated_point_on_stroke(obj_loc_2d, stroke, context)
-
-        newcoord = region_to_location(nearest_point, obj.location)
-        obj.location = obj.location.lerp(newcoord, influence)
-
-
-def get_nearest_interpolated_point_on_stroke(vertex_2d, points_2d, context):
-    # Define variables used for the two different axes (horizontal or vertical).
-    # Doing it like this in order to use the same code for both axes.
-    if is_vertical(vertex_2d, points_2d):
-        a = 1
-        b = 0
-    if not is_vertical(vertex_2d, points_2d):
-        a = 0
-        b = 1
-
-    # Variable for nearest point. Set to 9999 in order to guarantee a closer match.
-    nearest_distance = 9999.0
-    nearest_point = (0, 0)
-    point_upper = 0.0
-    point_lower = 0.0
-    coord_interpolated = 0
-
-    # I have a feeling this is not the best way to do this, but anyway;
-    # This bit of code finds (in 2D) the point (on a line) closest to another point.
-
-    # Works by finding the closest in one direction, then the other, then
-    # calculating the interpolated position between these two outer points.
-    for i, gpoint_2d in enumerate(points_2d):
-        # Variables used to find points relative to the current point (i),
-        # clamped to avoid out of range errors.
-        previous_point = clamp(0, len(points_2d)-1, i - 1)
-        next_point = clamp(0, len(points_2d)-1, i + 1)
-
-        # Gets the absolute (non-negative) distance from the
-        # current vertex to the current grease pencil point.
-        distance = abs(vertex_2d[a] - gpoint_2d[a])
-
-        # If the current gpencil point is the closest so far, calculate
-        # everything and push the values to the variables defined earlier.
-        if (distance < nearest_distance):
-            nearest_distance = distance
-            # If the nearest gpoint is ABOVE the current vertex,
-            # find the nearest point BELOW as well.
-            # TODO: Make this more readable/elegant? It works, so no need, but still.
-            if (gpoint_2d[a] >= vertex_2d[a]):
-                point_upper = gpoint_2d
-                point_lower = points_2d[previous_point]
-
-                # If the lower point is actually above the vertex,
-                # we picked the wrong point and need to correct.
-                if (point_lower[a] > point_upper[a]) or (point_upper == point_lower):
-                    point_lower = points_2d[next_point]
-            else:
-                # The opposite of the previous lines
-                point_lower = gpoint_2d
-                point_upper = points_2d[previous_point]
-                if (point_upper[a] <= point_lower[a]) or (point_upper == point_lower):
-                    point_upper = points_2d[next_point]
-
-            # Define min and max ranges to calculate the interpolated po<int from
-            hrange = (point_upper[b], point_lower[b])
-            vrange = (point_upper[a], point_lower[a])
-            coord_interpolated = map_range(vrange, hrange, vertex_2d[a])
-
-            # Push the interpolated coord to the correct axis
-            if a == 1:
-                nearest_point = (coord_interpolated, vertex_2d[1])
-            if a == 0:
-                nearest_point = (vertex_2d[0], coord_interpolated)
-
-    return nearest_point
-
-
-def get_closest_segment(vertex_2d, points_2d, context):
-    if is_vertical(vertex_2d, points_2d):
-        a = 1
-        b = 0
-    if not is_vertical(vertex_2d, points_2d):
-        a = 0
-        b = 1
-    nearest_distance = 9999.0
-    nearest_point = (0, 0)
-    point_upper = 0.0
-    point_lower = 0.0
-    coord_interpolated = 0
-    for i, gpoint_2d in enumerate(points_2d):
-        previous_point = clamp(0, len(points_2d)-1, i - 1)
-        next_point = clamp(0, len(points_2d)-1, i + 1)
-
-        distance = abs(vertex_2d[a] - gpoint_2d[a])
-
-        if (distance < nearest_distance):
-            nearest_distance = distance
-            if (gpoint_2d[a] >= vertex_2d[a]):
-                point_upper = gpoint_2d
-                point_lower = points_2d[previous_point]
-                if (point_lower[a] > point_upper[a]) or (point_upper == point_lower):
-                    point_lower = points_2d[next_point]
-            else:
-                point_lower = gpoint_2d
-                point_upper = points_2d[previous_point]
-                if (point_upper[a] <= point_lower[a]) or (point_upper == point_lower):
-                    point_upper = points_2d[next_point]
-
-    segment = (point_upper, point_lower)
-    return segment
-
-
-def gpencil_to_screenpos(context):
-    gp = None
-
-    sceneGP = bpy.context.scene.grease_pencil
-
-    if(check_if_scene_gp_exists(context)):
-        gp = sceneGP.layers[-1].active_frame
-
-    if(gp == None):
-        points_2d = [(0,0), (0,10)]
-    else:
-        points_2d = [location_to_region(point.co) for point in gp.strokes[-1].points if (len(gp.strokes) > 0)]
-        if bpy.context.preferences.addons[__name__].preferences.clear_strokes:
-            gp.strokes.remove(gp.strokes[-1])
-
-    
-    return points_2d
-
-
-def check_if_any_gp_exists(context):
-    return check_if_scene_gp_exists(context)
-
+    #     return align.check_if_any_gp_exists(context)
 
-def check_if_scene_gp_exists(context):
-    gps = bpy.context.scene.grease_pencil
-
-    if(gps is not None):
-        if(len(gps.layers)>0):
-            if(len(gps.layers[-1].active_frame.strokes) > 0):
-                return True
-
-    return False
-
-def vectors_to_screenpos(context, list_of_vectors, matrix):
-    if type(list_of_vectors) is mathutils.Vector:
-        return location_to_region(matrix @ list_of_vectors)
-    else:
-        return [location_to_region(matrix @ vector) for vector in list_of_vectors]
+class POSE_OT_bear_align_to_gpencil(AlignToGPencilProperties, Operator):
+    """Aligns selected pose bone chains to grease pencil stroke"""
+    bl_idname = "pose.bear_align_selection_to_gpencil"
+    bl_label = "Align pose bones to Grease Pencil"
+    bl_options = {'REGISTER', 'UNDO'}
 
+    insert_keyframes: BoolProperty(
+            name="Insert Keyframes",
+            description="Key the new bone locations and rotations on the current frame (always done with auto keying on)",
+            default=False,
+            )
 
-# Generic clamp function
-def clamp(a, b, v):
-    if (v <= a):
-        return a
-    elif (v >= b):
-        return b
-    else:
-        return v
+    def execute(self, context):
+        from . import align, profiling
+        with profiling.run(self, context):
+            # Pose mode
+            if context.mode == 'POSE':
+                solver = align.solver_for_operator(self, context)
+                if solver is None:
+                    self.report({'WARNING'}, "No annotation stroke found in view")
+                    return {'CANCELLED'}
+                insert_keyframes = self.insert_keyframes or context.scene.tool_settings.use_keyframe_insert_auto
+                align.align_pose_bones(context, self.influence, solver, insert_keyframes)
+                return {'FINISHED'}
+
+            self.report({'WARNING'}, "No valid cases found. Try again with another selection!")
+            return{'FINISHED'}
+
+class MESH_OT_bear_live_align_to_gpencil(Operator):
+    """Keeps aligning the selection to the last annotation stroke while it is drawn or edited. Enter to confirm, Esc to cancel"""
+    bl_idname = "mesh.bear_live_align_to_gpencil"
+    bl_label = "Live Align Verts to Grease Pencil"
+    bl_options = {'REGISTER', 'UNDO'}
 
+    influence: FloatProperty(
+            name="Influence",
+            description="Influence",
+            min=0.0, max=1.0,
+            default=1.0,
+            )
 
-# Function for determining if a sequence of 2D
-# coordinates form a vertical or horizontal line.
-def is_vertical(vertex, list_of_vec2):
-    if len(list_of_vec2) == 1:
-        if abs(list_of_vec2[0][0] - vertex[0]) > abs(list_of_vec2[0][1] - vertex[1]):
-            return True
-        else:
-            return False
+    time_budget: FloatProperty(
+            name="Time Budget",
+            description="Milliseconds spent solving per update. Big selections catch up over several updates",
+            min=1.0, soft_max=50.0,
+            default=8.0,
+            )
 
-    minval = list(map(min, *list_of_vec2))
-    maxval = list(map(max, *list_of_vec2))
+    def invoke(self, context, event):
+        if context.area.type != 'VIEW_3D' or context.mode != 'EDIT_MESH':
+            self.report({'WARNING'}, "Live align works on meshes in edit mode, in the 3D viewport")
+            return {'CANCELLED'}
+
+        from . import align
+        self._align = align.LiveAlign(context)
+        if not self._align.batches:
+            return {'CANCELLED'}
+
+        self._align.update(context, self.influence, self.time_budget / 1000.0)
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(LIVE_ALIGN_INTERVAL, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        # The timer must not outlive the operator, whatever goes wrong.
+        try:
+            return self.step(context, event)
+        except Exception:
+            self.finish(context)
+            raise
+
+    def step(self, context, event):
+        if context.mode != 'EDIT_MESH':
+            self.finish(context)
+            return {'CANCELLED'}
+
+        if event.type == 'ESC':
+            self._align.restore()
+            self.finish(context)
+            return {'CANCELLED'}
+
+        if event.type in {'RET', 'NUMPAD_ENTER'} and event.value == 'PRESS':
+            # Whatever is still pending is solved now, without a budget.
+            if not self._align.update(context, self.influence, None):
+                return self.stop_changed(context)
+            self.finish(context)
+            return {'FINISHED'}
 
-    if (maxval[0] - minval[0] > maxval[1] - minval[1]):
-        return False
-    if (maxval[0] - minval[0] < maxval[1] - minval[1]):
-        return True
-    
+        if event.type == 'TIMER':
+            if not self._align.update(context, self.influence, self.time_budget / 1000.0):
+                return self.stop_changed(context)
 
-# Generic map range function.
-# grabbed from here: www.rosettacode.org/wiki/Map_range
-def map_range(fromrange, torange, value):
-    (a1, a2), (b1, b2) = fromrange, torange
-    # WORKAROUND: If torange start and end is equal, division by zero occurs.
-    # A tiny amount is added to one of them to avoid a zero value here.
-    if (a1 == a2):
-        a2 += 0.0001
-    return b1 + ((value - a1) * (b2 - b1) / (a2 - a1))
+        # Everything else goes through, so the stroke can be drawn and the view navigated.
+        return {'PASS_THROUGH'}
 
-# Utility functions for converting between 2D and 3D coordinates
-def location_to_region(worldcoords):
-    out = view3d_utils.location_3d_to_region_2d(bpy.context.region, bpy.context.space_data.region_3d, worldcoords)
-    return out
+    # Undo, delete, subdivide... were run while live: the stored selection no longer matches the mesh.
+    def stop_changed(self, context):
+        self.report({'WARNING'}, "Mesh changed during live align, stopped")
+        self.finish(context)
+        return {'CANCELLED'}
 
+    def cancel(self, context):
+        self.finish(context)
 
-def region_to_location(viewcoords, depthcoords):
-    return view3d_utils.region_2d_to_location_3d(bpy.context.region, bpy.context.space_data.region_3d, viewcoords, depthcoords)
+    def finish(self, context):
+        if self._timer is not None:
+            context.window_manager.event_timer_remove(self._timer)
+            self._timer = None
 
 classes = (OBJECT_OT_bear_align_to_gpencil,
     UV_OT_bear_align_to_gpencil,
     MESH_OT_bear_align_to_gpencil,
     CURVE_OT_bear_align_to_gpencil,
     ARMATURE_OT_bear_align_to_gpencil,
-    PREFS_bear_align_to_gpencil,
-    PREFS_OT_rebind)
+    POSE_OT_bear_align_to_gpencil,
+    MESH_OT_bear_live_align_to_gpencil,
+    PREFS_bear_align_to_gpencil)
+
+# Keymaps the default shortcut goes in, and the operator it runs in each.
+KEYMAP_ITEMS = (
+    ("Mesh", "mesh.bear_align_selection_to_gpencil"),
+    ("Object Mode", "object.bear_align_selection_to_gpencil"),
+    ("UV Editor", "uv.bear_align_selection_to_gpencil"),
+    ("Armature", "armature.bear_align_selection_to_gpencil"),
+    ("Pose", "pose.bear_align_selection_to_gpencil"),
+    ("Curve", "curve.bear_align_selection_to_gpencil"),
+)
 
 addon_keymaps = []
 
-def bind_keymap():
-    pref = bpy.context.preferences.addons[__name__].preferences
+# Makes the default shortcut in every keymap of KEYMAP_ITEMS from the preferences, replacing
+# the items made before. Only runs on register and when a shortcut setting changes.
+def bind_keymap(pref=None):
+    unbind_keymap()
+    if pref is None:
+        pref = bpy.context.preferences.addons[__name__].preferences
     # If user doesn't want to create default hotkey, we shall not do so
     if not pref.use_default_shortcut:
         return
 
-    # Check if hotkey has already been set, to avoid duplicates when auto creating hotkey
-    try:
-        km = bpy.context.window_manager.keyconfigs.addon.keymaps["Mesh"]
-    except Exception as e:
-        km = bpy.context.window_manager.keyconfigs.addon.keymaps.new("Mesh", space_type='EMPTY', region_type='WINDOW')
-        pass
-
-    if "mesh.bear_align_selection_to_gpencil" not in km.keymap_items:
-        kmi = km.keymap_items.new(idname="mesh.bear_align_selection_to_gpencil", type=pref.mouse_click , value='DOUBLE_CLICK', any=False, alt=pref.use_alt, ctrl=pref.use_ctrl, shift=pref.use_shift)
-        addon_keymaps.append((km, kmi))
-
-    try:
-        km = bpy.context.window_manager.keyconfigs.addon.keymaps["Object Mode"]
-    except Exception as e:
-        km = bpy.context.window_manager.keyconfigs.addon.keymaps.new("Object Mode", space_type='EMPTY', region_type='WINDOW')
-        pass
-
-    if "object.bear_align_selection_to_gpencil" not in km.keymap_items:
-        kmi = km.keymap_items.new(idname="object.bear_align_selection_to_gpencil", type=pref.mouse_click , value='DOUBLE_CLICK', any=False, alt=pref.use_alt, ctrl=pref.use_ctrl, shift=pref.use_shift)
-        addon_keymaps.append((km, kmi))
-
-    try:
-        km = bpy.context.window_manager.keyconfigs.addon.keymaps["UV Editor"]
-    except Exception as e:
-        km = bpy.context.window_manager.keyconfigs.addon.keymaps.new("UV Editor", space_type='EMPTY', region_type='WINDOW')
-        pass
-
-    if "uv.bear_align_selection_to_gpencil" not in km.keymap_items:
-        kmi = km.keymap_items.new(idname="uv.bear_align_selection_to_gpencil", type=pref.mouse_click , value='DOUBLE_CLICK', any=False, alt=pref.use_alt, ctrl=pref.use_ctrl, shift=pref.use_shift)
-        addon_keymaps.append((km, kmi))
-
-    try:
-        km = bpy.context.window_manager.keyconfigs.addon.keymaps["Armature"]
-    except Exception as e:
-        km = bpy.context.window_manager.keyconfigs.addon.keymaps.new("Armature", space_type='EMPTY', region_type='WINDOW')
-        pass
-
-    if "armature.bear_align_selection_to_gpencil" not in km.keymap_items:
-        kmi = km.keymap_items.new(idname="armature.bear_align_selection_to_gpencil", type=pref.mouse_click , value='DOUBLE_CLICK', any=False, alt=pref.use_alt, ctrl=pref.use_ctrl, shift=pref.use_shift)
-        addon_keymaps.append((km, kmi))
-
-    try:
-        km = bpy.context.window_manager.keyconfigs.addon.keymaps["Curve"]
-    except Exception as e:
-        km = bpy.context.window_manager.keyconfigs.addon.keymaps.new("Curve", space_type='EMPTY', region_type='WINDOW')
-        pass
+    # No addon keyconfig in background mode.
+    kc = bpy.context.window_manager.keyconfigs.addon
+    if kc is None:
+        return
 
-    if "curve.bear_align_selection_to_gpencil" not in km.keymap_items:
-        kmi = km.keymap_items.new(idname="curve.bear_align_selection_to_gpencil", type=pref.mouse_click , value='DOUBLE_CLICK', any=False, alt=pref.use_alt, ctrl=pref.use_ctrl, shift=pref.use_shift)
+    for keymap_name, idname in KEYMAP_ITEMS:
+        km = kc.keymaps.get(keymap_name)
+        if km is None:
+            km = kc.keymaps.new(keymap_name, space_type='EMPTY', region_type='WINDOW')
+        kmi = km.keymap_items.new(idname=idname, type=pref.mouse_click, value='DOUBLE_CLICK', any=False, alt=pref.use_alt, ctrl=pref.use_ctrl, shift=pref.use_shift)
         addon_keymaps.append((km, kmi))
 
 
@@ -630,10 +497,36 @@ def unbind_keymap():
         km.keymap_items.remove(kmi)
     addon_keymaps.clear()
 
+# Surface snapping keeps BVH trees of the meshes it snaps to, and drops them when they change.
+# X-mirror keeps mirror maps by mesh name, which mean nothing in another file.
+# The handlers are on from the start, but only reach into these modules once a run has loaded them.
+def loaded_module(name):
+    return sys.modules.get(__name__ + "." + name)
+
+def clear_caches():
+    surface_snap = loaded_module("surface_snap")
+    if surface_snap is not None:
+        surface_snap.invalidate()
+    mirror = loaded_module("mirror")
+    if mirror is not None:
+        mirror.clear()
+
+@persistent
+def on_depsgraph_update(scene, depsgraph):
+    surface_snap = loaded_module("surface_snap")
+    if surface_snap is not None:
+        surface_snap.invalidate_updated(depsgraph)
+
+@persistent
+def on_load(*args):
+    clear_caches()
+
 def register():
     from bpy.utils import register_class
     for cls in classes:
         register_class(cls)
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
+    bpy.app.handlers.load_post.append(on_load)
     bind_keymap()
  
  
@@ -641,6 +534,11 @@ def unregister():
     from bpy.utils import unregister_class
     for cls in reversed(classes):
         unregister_class(cls)
+    if on_depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(on_depsgraph_update)
+    if on_load in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(on_load)
+    clear_caches()
     unbind_keymap()
        
         
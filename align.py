@@ -0,0 +1,793 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# The alignment engines, and the annotation stroke reading they share.
+#
+# The operators in __init__ only import this module when they first run, so
+# NumPy and the solver modules don't load with Blender when the addon is on.
+
+import bmesh
+import bpy
+import mathutils
+import numpy as np
+
+from . import curve_io
+from . import live_stroke
+from . import mesh_io
+from . import mirror
+from . import profiling
+from . import proportional
+from . import stroke_distribution
+from . import stroke_preprocess
+from . import stroke_solver
+from . import surface_snap
+from . import transforms
+from . import view_projection
+
+
+class LiveAlign:
+    """Selected vertices of the meshes in edit mode, kept aligned to the last annotation stroke as it changes"""
+
+    def __init__(self, context):
+        # The view is captured once: vertices keep their screen positions from when the operator started.
+        self.view = view_projection.ViewProjection.from_context(context)
+        # Each batch keeps its mesh's vertex count, to notice topology edits made while live.
+        self.batches = []
+        for obj in context.objects_in_mode:
+            if obj.type == 'MESH':
+                indices, verts_local_3d = mesh_io.read_selected_vertices(obj)
+                self.batches.append((obj, len(obj.data.vertices), indices, verts_local_3d, transforms.ObjectTransform(obj.matrix_world)))
+        if not self.batches:
+            return
+
+        # Vertices are always solved from their original positions.
+        self.verts_world_3d = np.concatenate([transform.to_world(verts_local_3d) for _, _, _, verts_local_3d, transform in self.batches])
+        self.live = live_stroke.LiveStrokeIndex(self.view.to_region(self.verts_world_3d))
+
+    # The edit BMesh of every batch, taken again each time: undo and other edits made while
+    # live rebuild it. None if a mesh is gone or its vertex count changed, as the stored
+    # vertex indices can't be trusted then.
+    def bmeshes(self):
+        bms = []
+        for obj, vertex_count, _, _, _ in self.batches:
+            try:
+                if not obj.data.is_editmode:
+                    return None
+                bm = bmesh.from_edit_mesh(obj.data)
+            except ReferenceError:
+                return None
+            if len(bm.verts) != vertex_count:
+                return None
+            bms.append(bm)
+        return bms
+
+    # Picks up stroke changes, then solves as many pending vertices as the budget allows.
+    # Returns False, without changing anything, if the meshes changed under it (see bmeshes).
+    def update(self, context, influence, time_budget):
+        bms = self.bmeshes()
+        if bms is None:
+            return False
+
+        stroke_2d = gpencil_to_screenpos(context, self.view, clear=False)
+        if len(stroke_2d) > 0:
+            self.live.update(stroke_2d)
+
+        solved = self.live.solve(time_budget)
+        if len(solved) == 0:
+            return True
+
+        newcoords_world = np.full_like(self.verts_world_3d, np.nan)
+        newcoords_world[solved] = self.view.to_world(self.live.closest[solved], self.verts_world_3d[solved])
+
+        start = 0
+        for (obj, _, indices, verts_local_3d, transform), bm in zip(self.batches, bms):
+            end = start + len(indices)
+            in_batch = solved[(solved >= start) & (solved < end)]
+            moved = in_batch - start
+            start = end
+            if len(moved) == 0:
+                continue
+
+            newcoords = transform.to_local(newcoords_world[in_batch])
+            newcoords = transforms.lerp(verts_local_3d[moved], newcoords, influence)
+            mesh_io.update_normals(mesh_io.write_vertices(bm, indices[moved], newcoords))
+            bmesh.update_edit_mesh(obj.data, False, False)
+        return True
+
+    # Puts every vertex back where it was. Returns False if the meshes changed under it.
+    def restore(self):
+        bms = self.bmeshes()
+        if bms is None:
+            return False
+        for (obj, _, indices, verts_local_3d, _), bm in zip(self.batches, bms):
+            mesh_io.update_normals(mesh_io.write_vertices(bm, indices, verts_local_3d))
+            bmesh.update_edit_mesh(obj.data, False, False)
+        return True
+
+
+def align_bones_editmode(context, influence, solver, distribution='SNAP'):
+    obj = context.edit_object
+    bo = obj.data.edit_bones
+
+    with profiling.stage("read bones", len(bo)):
+        selected_bones = [bone for bone in bo if bone.select]
+        count = len(selected_bones)
+
+        # Heads and tails are solved together in a single batch: heads first, then tails.
+        bone_points_local_3d = np.array([bone.head for bone in selected_bones] + [bone.tail for bone in selected_bones]).reshape(-1, 3)
+
+    transform = transforms.ObjectTransform(obj.matrix_world)
+    bone_points_world_3d = transform.to_world(bone_points_local_3d)
+    with profiling.stage("solve", len(bone_points_local_3d)):
+        if distribution == 'SNAP':
+            newcoords = solver.solve(bone_points_world_3d)
+        else:
+            chains, connected = bone_chains(selected_bones)
+            newcoords = solver.distribute(bone_points_world_3d, chains, distribution)
+            # Connected bones start where their parent now ends.
+            for child, parent in connected:
+                newcoords[child] = newcoords[count + parent]
+    newcoords = transforms.lerp(bone_points_local_3d, transform.to_local(newcoords), influence)
+
+    with profiling.stage("write bones", count):
+        for i, bone in enumerate(selected_bones):
+            if is_solved(newcoords[i]):
+                bone.head = newcoords[i]
+            if is_solved(newcoords[count + i]):
+                bone.tail = newcoords[count + i]
+
+
+# Chains of connected bones, for distributing along the stroke. Rows are into the batch
+# of bone points align_bones_editmode solves (heads, then tails): a chain is its first
+# bone's head, then every tail. A chain stops where a bone has several selected children.
+# Returns (chains, (child, parent) pairs of bones whose head follows their parent's tail).
+def bone_chains(selected_bones):
+    count = len(selected_bones)
+    rows = {bone.name: i for i, bone in enumerate(selected_bones)}
+    children = {}
+    for i, bone in enumerate(selected_bones):
+        if bone.use_connect and bone.parent is not None and bone.parent.name in rows:
+            children.setdefault(rows[bone.parent.name], []).append(i)
+    next_bone = {parent: kids[0] for parent, kids in children.items() if len(kids) == 1}
+    followers = set(next_bone.values())
+
+    chains = []
+    connected = []
+    for first in range(count):
+        if first in followers:
+            continue
+        chain = [first, count + first]
+        bone = first
+        while bone in next_bone:
+            connected.append((next_bone[bone], bone))
+            bone = next_bone[bone]
+            chain.append(count + bone)
+        chains.append(stroke_distribution.Chain(chain))
+    return chains, connected
+
+
+def align_pose_bones(context, influence, solver, insert_keyframes=False):
+    # Selected pose bones, per armature.
+    armatures = {}
+    for pb in context.selected_pose_bones or []:
+        armatures.setdefault(pb.id_data, []).append(pb)
+
+    # Joints (heads and tails, in pose space) to solve. A bone connected to a selected
+    # parent shares its head with the parent's tail, so the joint is only solved once.
+    chains = []
+    for obj, pose_bones in armatures.items():
+        # Parents before children.
+        pose_bones.sort(key=lambda pb: len(pb.parent_recursive))
+        selected = {pb.name for pb in pose_bones}
+        joints = []
+        head_joint = {}
+        tail_joint = {}
+        for pb in pose_bones:
+            if pb.bone.use_connect and pb.parent is not None and pb.parent.name in selected:
+                head_joint[pb.name] = tail_joint[pb.parent.name]
+            else:
+                head_joint[pb.name] = len(joints)
+                joints.append(pb.head)
+            tail_joint[pb.name] = len(joints)
+            joints.append(pb.tail)
+
+        joints_local_3d = np.array(joints).reshape(-1, 3)
+        chains.append((obj, pose_bones, head_joint, tail_joint, joints_local_3d, transforms.ObjectTransform(obj.matrix_world)))
+
+    if not chains:
+        return
+
+    # Every joint of every chain in one batch.
+    joints_world_3d = np.concatenate([transform.to_world(joints_local_3d) for _, _, _, _, joints_local_3d, transform in chains])
+    with profiling.stage("solve", len(joints_world_3d)):
+        newjoints_world = solver.solve(joints_world_3d)
+
+    with profiling.stage("write pose", sum(len(pose_bones) for _, pose_bones, _, _, _, _ in chains)):
+        start = 0
+        for obj, pose_bones, head_joint, tail_joint, joints_local_3d, transform in chains:
+            end = start + len(joints_local_3d)
+            newjoints = transform.to_local(newjoints_world[start:end])
+            start = end
+            newjoints = transforms.lerp(joints_local_3d, newjoints, influence)
+            # Joints that could not be solved stay where they are.
+            newjoints = np.where(np.isnan(newjoints), joints_local_3d, newjoints)
+
+            # Each bone is placed at its head joint, or at its parent's new tail when connected,
+            # and turned to point at its tail joint. Bone lengths don't change.
+            new_pose = {}
+            for pb in pose_bones:
+                matrix = pb.matrix.copy()
+                parent = pb.parent
+                if pb.bone.use_connect and parent is not None:
+                    if parent.name in new_pose:
+                        head = new_pose[parent.name] @ mathutils.Vector((0.0, parent.length, 0.0))
+                    else:
+                        head = pb.head.copy()
+                else:
+                    head = mathutils.Vector(newjoints[head_joint[pb.name]])
+
+                aim = mathutils.Vector(newjoints[tail_joint[pb.name]]) - head
+                if aim.length > 1e-6:
+                    rotation = matrix.col[1].xyz.rotation_difference(aim).to_matrix()
+                    matrix = (rotation @ matrix.to_3x3()).to_4x4()
+                matrix.translation = head
+                new_pose[pb.name] = matrix
+
+                # Pose space back to the bone's own space: pose = parent pose @ (parent rest)^-1 @ rest @ basis.
+                rest = pb.bone.matrix_local
+                if parent is not None:
+                    parent_pose = new_pose.get(parent.name, parent.matrix)
+                    rest = parent_pose @ parent.bone.matrix_local.inverted() @ rest
+                pb.matrix_basis = rest.inverted() @ matrix
+
+                if insert_keyframes:
+                    pb.keyframe_insert("location", group=pb.name)
+                    pb.keyframe_insert(pose_rotation_path(pb), group=pb.name)
+
+
+# Data path of the rotation property a pose bone uses.
+def pose_rotation_path(pb):
+    if pb.rotation_mode == 'QUATERNION':
+        return "rotation_quaternion"
+    if pb.rotation_mode == 'AXIS_ANGLE':
+        return "rotation_axis_angle"
+    return "rotation_euler"
+
+
+def align_vertices(context, influence, solver, bulk_io=True, snap_to_surface=False, proportional_settings=None, distribution='SNAP'):
+    # All mesh objects currently in edit mode, solved together in one batch.
+    objects = [obj for obj in context.objects_in_mode if obj.type == 'MESH']
+
+    batches = []
+    chains = []
+    count = 0
+    for obj in objects:
+        # Convert mesh data to bmesh.
+        with profiling.stage("from_edit_mesh", len(obj.data.vertices)):
+            bm = bmesh.from_edit_mesh(obj.data)
+
+        # Get all selected vertices (indices, and coordinates in their local space).
+        with profiling.stage("read selection") as stage:
+            if bulk_io:
+                indices, verts_local_3d = mesh_io.read_selected_vertices(obj)
+            else:
+                indices, verts_local_3d = mesh_io.scan_selected_vertices(bm)
+            stage.count = len(indices)
+
+        # Spreading the selection along the stroke follows its edges (edge loops and paths).
+        if distribution != 'SNAP':
+            with profiling.stage("read edges") as stage:
+                edges = mesh_io.read_selected_edges(obj, indices, flush=not bulk_io)
+                chains.extend(chain.shifted(count) for chain in stroke_distribution.chains_from_edges(len(indices), edges))
+                stage.count = len(edges)
+        count += len(indices)
+
+        # IMPORTANT: Vertices are aligned in WORLD space, so each object's batch is converted with its
+        # world matrix on the way in, and with its INVERTED world matrix on the way out.
+        transform = transforms.ObjectTransform(obj.matrix_world)
+        batches.append((obj, bm, indices, verts_local_3d, transform))
+
+    if not batches:
+        return
+
+    # For each vert, look up or to the side and find the nearest interpolated gpencil point for this vertex,
+    # then convert it back from 2D screen space to 3D world space at the vertex's own depth.
+    verts_world_3d = np.concatenate([transform.to_world(verts_local_3d) for _, _, _, verts_local_3d, transform in batches])
+    with profiling.stage("solve", len(verts_world_3d)):
+        if distribution == 'SNAP':
+            newcoords_world = solver.solve(verts_world_3d)
+        else:
+            newcoords_world = solver.distribute(verts_world_3d, chains, distribution)
+
+    # Optionally drop them onto the surface under their new screen position instead.
+    if snap_to_surface:
+        with profiling.stage("snap to surface", len(newcoords_world)):
+            newcoords_world = surface_snap.snap_points(context, solver.view, newcoords_world)
+
+    start = 0
+    for obj, bm, indices, verts_local_3d, transform in batches:
+        end = start + len(indices)
+        newcoords = transform.to_local(newcoords_world[start:end])
+        start = end
+
+        # Apply the final position using an influence slider.
+        newcoords = transforms.lerp(verts_local_3d, newcoords, influence)
+
+        # With proportional editing, unselected vertices nearby follow along.
+        if proportional_settings is not None:
+            with profiling.stage("proportional") as stage:
+                view_axis = solver.view.view_inverse[:3, 2] if proportional_settings.projected else None
+                follow_indices, follow_coords = proportional.follow_selection(
+                    obj, bm, indices, verts_local_3d, newcoords, proportional_settings, view_axis, flush=not bulk_io)
+                indices = np.concatenate((indices, follow_indices))
+                newcoords = np.concatenate((newcoords, follow_coords))
+                stage.count = len(follow_indices)
+
+        # With X mirror editing, the counterparts of everything moved get the mirrored displacement.
+        if obj.data.use_mirror_x:
+            with profiling.stage("mirror") as stage:
+                coords = mesh_io.read_vertex_coords(obj, flush=not bulk_io)
+                mirror_map = mirror.get_mirror_map(obj.data, coords)
+                mirror_indices, mirror_coords = mirror.mirror_displacement(mirror_map, coords, indices, newcoords)
+                indices = np.concatenate((indices, mirror_indices))
+                newcoords = np.concatenate((newcoords, mirror_coords))
+                stage.count = len(mirror_indices)
+
+        with profiling.stage("write", len(indices)):
+            moved_verts = mesh_io.write_vertices(bm, indices, newcoords)
+
+        # Recalculate normals around the moved vertices (so lighting looks right).
+        with profiling.stage("normal_update", len(moved_verts)):
+            mesh_io.update_normals(moved_verts)
+
+        # Push bmesh changes back to the actual mesh datablock.
+        with profiling.stage("update_edit_mesh", len(moved_verts)):
+            bmesh.update_edit_mesh(obj.data, True)
+
+
+def align_uvs(context, influence, solver):
+    uv_sync = context.scene.tool_settings.use_uv_select_sync
+    # All mesh objects currently in edit mode (and with UVs), solved together in one batch.
+    objects = [obj for obj in context.objects_in_mode if obj.type == 'MESH' and obj.data.uv_layers.active is not None]
+
+    batches = []
+    for obj in objects:
+        with profiling.stage("read UVs") as stage:
+            bm = bmesh.from_edit_mesh(obj.data)
+            faces, corners, loop_verts, uvs = mesh_io.read_selected_uvs(obj, uv_sync)
+            stage.count = len(uvs)
+        batches.append((obj, bm, faces, corners, loop_verts, uvs))
+
+    if not batches:
+        return
+
+    # Loops of the same object sharing a mesh vertex and a UV position are one UV vertex
+    # (they only split along seams), so each UV vertex is solved once.
+    uv_vertices = np.concatenate([np.column_stack((np.full(len(uvs), i), loop_verts, uvs))
+                                  for i, (_, _, _, _, loop_verts, uvs) in enumerate(batches)])
+    uv_vertices, loop_to_uv_vertex = np.unique(uv_vertices, axis=0, return_inverse=True)
+    loop_to_uv_vertex = loop_to_uv_vertex.ravel()
+
+    # UVs are solved as 3D points with a zero third component, see view_projection.UVProjection.
+    uvs_3d = np.zeros((len(uv_vertices), 3))
+    uvs_3d[:, :2] = uv_vertices[:, 2:]
+    with profiling.stage("solve", len(uvs_3d)):
+        newcoords = solver.solve(uvs_3d)[:, :2]
+
+    # Apply the final position using an influence slider.
+    newcoords = transforms.lerp(uv_vertices[:, 2:], newcoords, influence)[loop_to_uv_vertex]
+
+    start = 0
+    for obj, bm, faces, corners, _, uvs in batches:
+        end = start + len(uvs)
+        with profiling.stage("write UVs", len(uvs)):
+            mesh_io.write_uvs(bm, faces, corners, newcoords[start:end])
+        start = end
+
+        with profiling.stage("update_edit_mesh", len(uvs)):
+            bmesh.update_edit_mesh(obj.data, False, False)
+
+
+def align_curves(context, influence, solver, handle_mode='TANGENT', distribution='SNAP'):
+    # Selected points of every spline of every curve in edit mode, each spline read
+    # according to its own type.
+    bezier_splines = []
+    point_splines = []
+    with profiling.stage("read splines") as stage:
+        for obj in context.objects_in_mode:
+            if obj.type != 'CURVE':
+                continue
+            transform = transforms.ObjectTransform(obj.matrix_world)
+            for spline in obj.data.splines:
+                if spline.type == 'BEZIER':
+                    rows, co, handle_left, handle_right = curve_io.read_bezier_points(spline)
+                    if len(rows):
+                        bezier_splines.append((obj, spline, transform, rows, co, handle_left, handle_right))
+                else:
+                    rows, co = curve_io.read_spline_points(spline)
+                    if len(rows):
+                        point_splines.append((obj, spline, transform, rows, co))
+        stage.count = len(bezier_splines) + len(point_splines)
+
+    if not bezier_splines and not point_splines:
+        return
+
+    # Bezier control points first, then poly/NURBS points (their weight is left alone): all in one batch.
+    co_world = np.concatenate([transform.to_world(co[rows]) for _, _, transform, rows, co, _, _ in bezier_splines] +
+                              [transform.to_world(co[rows, :3]) for _, _, transform, rows, co in point_splines])
+    with profiling.stage("solve", len(co_world)):
+        if distribution == 'SNAP':
+            newco_world = solver.solve(co_world)
+        else:
+            newco_world = solver.distribute(co_world, spline_chains(bezier_splines + point_splines), distribution)
+    bezier_count = sum(len(rows) for _, _, _, rows, _, _, _ in bezier_splines)
+
+    if bezier_splines:
+        left_world = np.concatenate([transform.to_world(handle_left[rows]) for _, _, transform, rows, _, handle_left, _ in bezier_splines])
+        right_world = np.concatenate([transform.to_world(handle_right[rows]) for _, _, transform, rows, _, _, handle_right in bezier_splines])
+        with profiling.stage("handles", bezier_count):
+            newleft_world, newright_world = solve_bezier_handles(solver, co_world[:bezier_count], newco_world[:bezier_count],
+                                                                 left_world, right_world, handle_mode)
+
+    with profiling.stage("write splines", len(co_world)):
+        start = 0
+        for obj, spline, transform, rows, co, handle_left, handle_right in bezier_splines:
+            end = start + len(rows)
+            solved_co = transform.to_local(newco_world[start:end])
+            solved_left = transform.to_local(newleft_world[start:end])
+            solved_right = transform.to_local(newright_world[start:end])
+            start = end
+
+            newco = transforms.lerp(co[rows], solved_co, influence)
+            if handle_mode == 'TANGENT':
+                newleft, newright = blend_handles(co[rows], handle_left[rows], handle_right[rows], newco,
+                                                  solved_co, solved_left, solved_right, influence)
+            else:
+                newleft = transforms.lerp(handle_left[rows], solved_left, influence)
+                newright = transforms.lerp(handle_right[rows], solved_right, influence)
+
+            moved = ~(np.isnan(newco).any(axis=1) | np.isnan(newleft).any(axis=1) | np.isnan(newright).any(axis=1))
+            co[rows[moved]] = newco[moved]
+            handle_left[rows[moved]] = newleft[moved]
+            handle_right[rows[moved]] = newright[moved]
+
+            if handle_mode == 'TANGENT':
+                align_handle_types(spline.bezier_points, rows[moved])
+
+            curve_io.write_bezier_points(spline, co, handle_left, handle_right)
+
+        for obj, spline, transform, rows, co in point_splines:
+            end = start + len(rows)
+            newcoords = transforms.lerp(co[rows, :3], transform.to_local(newco_world[start:end]), influence)
+            start = end
+            solved = ~np.isnan(newcoords).any(axis=1)
+            co[rows[solved], :3] = newcoords[solved]
+            curve_io.write_spline_points(spline, co)
+
+    for obj in {batch[0] for batch in bezier_splines + point_splines}:
+        obj.data.update_tag()
+
+
+# Chains of the selected points of each spline, in the order the splines are batched,
+# for distributing along the stroke. Cyclic splines with every point selected are closed.
+def spline_chains(splines):
+    chains = []
+    start = 0
+    for batch in splines:
+        spline, rows = batch[1], batch[3]
+        closed = spline.use_cyclic_u and len(rows) == len(spline.bezier_points if spline.type == 'BEZIER' else spline.points)
+        chains.append(stroke_distribution.Chain(np.arange(start, start + len(rows)), closed))
+        start += len(rows)
+    return chains
+
+
+# Handles that Blender would recalculate (AUTO/VECTOR) are made ALIGNED to keep the tangent.
+# Every type change recalculates the handles of the whole spline, so the types are all
+# read first and only the ones that change are set. This goes before the coordinates are
+# written, which replaces what the recalculation did.
+def align_handle_types(points, rows):
+    changes = [(points[row], attr) for row in rows.tolist() for attr in ("handle_left_type", "handle_right_type")
+               if getattr(points[row], attr) in {'AUTO', 'VECTOR'}]
+    for point, attr in changes:
+        setattr(point, attr, 'ALIGNED')
+
+
+# Handles (N, 3) for control points moved part of the way (influence) from co to newco,
+# given the handles solved for moving all the way to solved_co. Both handles stay on one
+# line through newco, so they stay aligned: the line turns from the old handles' direction
+# towards the solved one, and each handle's length goes from the old to the solved length.
+def blend_handles(co, left, right, newco, solved_co, solved_left, solved_right, influence):
+    chord = transforms.lerp(right - left, solved_right - solved_left, influence)
+    length = np.linalg.norm(chord, axis=1)
+    # Without a direction (handles of zero length), the solved one is used.
+    solved_chord = solved_right - solved_left
+    flat = length <= 0.0
+    chord[flat] = solved_chord[flat]
+    length[flat] = np.linalg.norm(solved_chord[flat], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        direction = chord / length[:, None]
+    direction[length == 0.0] = 0.0
+
+    left_length = transforms.lerp(np.linalg.norm(left - co, axis=1), np.linalg.norm(solved_left - solved_co, axis=1), influence)
+    right_length = transforms.lerp(np.linalg.norm(right - co, axis=1), np.linalg.norm(solved_right - solved_co, axis=1), influence)
+    return newco - direction * left_length[:, None], newco + direction * right_length[:, None]
+
+
+# New Bezier handles (world space) for control points moved from co_world to newco_world.
+# 'TANGENT': the handles are laid along the stroke's screen-space direction at the new point,
+# keeping their screen length and which side each one was on.
+# 'KEEP': the handles move along with their control point.
+# Handles of points that could not be solved come back as NaN, like the points.
+def solve_bezier_handles(solver, co_world, newco_world, left_world, right_world, handle_mode='TANGENT'):
+    offset = newco_world - co_world
+    if handle_mode != 'TANGENT':
+        return left_world + offset, right_world + offset
+
+    view = solver.view
+    co_2d = view.to_region(co_world)
+    left_2d = view.to_region(left_world)
+    right_2d = view.to_region(right_world)
+    newco_2d = view.to_region(newco_world)
+    tangent = solver.tangents(newco_2d)
+
+    # Point the tangent the way the right handle pointed before.
+    side = np.einsum('ij,ij->i', tangent, right_2d - left_2d)
+    tangent *= np.where(side < 0.0, -1.0, 1.0)[:, None]
+
+    left_length = np.linalg.norm(left_2d - co_2d, axis=1)[:, None]
+    right_length = np.linalg.norm(right_2d - co_2d, axis=1)[:, None]
+    # Both handles go at the depth of the new control point, so they are on one line
+    # through it in 3D, not just on screen (ALIGNED handles must be).
+    newleft_world = view.to_world(newco_2d - tangent * left_length, newco_world)
+    newright_world = view.to_world(newco_2d + tangent * right_length, newco_world)
+
+    # Without a usable tangent (or a handle off screen), handles just follow their point.
+    unsolved = np.isnan(newleft_world).any(axis=1) | np.isnan(newright_world).any(axis=1)
+    newleft_world[unsolved] = (left_world + offset)[unsolved]
+    newright_world[unsolved] = (right_world + offset)[unsolved]
+    return newleft_world, newright_world
+
+
+def align_objects(context, influence, solver, insert_keyframes=False):
+    selected = set(context.selected_editable_objects)
+    # Objects under a selected parent already move with it (like Blender's own transform).
+    objects = [obj for obj in context.selected_editable_objects if not any(parent in selected for parent in object_parents(obj))]
+    if not objects:
+        return
+
+    # Objects are aligned by their world space origin, all in one batch.
+    matrices = np.array([obj.matrix_world for obj in objects], dtype=np.float64).reshape(-1, 4, 4)
+    origins_world = matrices[:, :3, 3]
+    with profiling.stage("solve", len(origins_world)):
+        offsets_world = transforms.lerp(origins_world, solver.solve(origins_world), influence) - origins_world
+
+    # Location lives in the space the parent (through the parent inverse) puts the object in,
+    # so world offsets go back through that matrix. Objects under a parent scaled to zero
+    # can't be moved there, and are left unsolved.
+    parent_spaces = np.array([parent_space(obj) for obj in objects], dtype=np.float64).reshape(-1, 4, 4)
+    parent_axes = parent_spaces[:, :3, :3]
+    # The determinant relative to the product of the axis lengths (which bounds it): 0 for
+    # collapsed axes whatever the overall scale.
+    invertible = np.abs(np.linalg.det(parent_axes)) > 1e-9 * np.prod(np.linalg.norm(parent_axes, axis=1), axis=-1)
+    parent_inverses = np.full_like(parent_axes, np.nan)
+    parent_inverses[invertible] = np.linalg.inv(parent_axes[invertible])
+    offsets_local = np.einsum('nij,nj->ni', parent_inverses, offsets_world)
+
+    locked = np.array([tuple(obj.lock_location) for obj in objects], dtype=bool).reshape(-1, 3)
+    offsets_local[locked] = 0.0
+
+    locations = np.array([obj.location for obj in objects], dtype=np.float64).reshape(-1, 3) + offsets_local
+    with profiling.stage("write locations", len(objects)):
+        for obj, location, offset in zip(objects, locations.tolist(), offsets_local):
+            if is_solved(offset):
+                obj.location = location
+
+    if insert_keyframes:
+        frame = context.scene.frame_current
+        keyed = [obj for obj, offset in zip(objects, offsets_local) if is_solved(offset)]
+        with profiling.stage("keyframes", len(keyed)):
+            insert_location_keyframes(keyed, frame)
+
+
+# All the parents of an object, closest first.
+def object_parents(obj):
+    parents = []
+    parent = obj.parent
+    while parent is not None:
+        parents.append(parent)
+        parent = parent.parent
+    return parents
+
+
+# Matrix taking an object's location (and the rest of its basis) to world space.
+def parent_space(obj):
+    if obj.parent is None:
+        return mathutils.Matrix.Identity(4)
+    if obj.parent_type == 'OBJECT':
+        return obj.parent.matrix_world @ obj.matrix_parent_inverse
+    # Bone, vertex and other parents: whatever sits between the basis and the world matrix.
+    return obj.matrix_world @ obj.matrix_basis.inverted_safe()
+
+
+# Keys the location of many objects on one frame. Keyframes go straight into the
+# F-curves with the FAST flag, and each F-curve is updated once at the end.
+def insert_location_keyframes(objects, frame):
+    fcurves = []
+    for obj in objects:
+        if obj.animation_data is None:
+            obj.animation_data_create()
+        if obj.animation_data.action is None:
+            obj.animation_data.action = bpy.data.actions.new(obj.name + "Action")
+        action = obj.animation_data.action
+
+        for index in range(3):
+            fcurve = action.fcurves.find("location", index=index)
+            if fcurve is None:
+                fcurve = action.fcurves.new("location", index=index, action_group="Object Transforms")
+            fcurve.keyframe_points.insert(frame, obj.location[index], options={'FAST'})
+            fcurves.append(fcurve)
+
+    for fcurve in fcurves:
+        fcurve.update()
+
+
+def is_solved(coord):
+    return not np.isnan(coord).any()
+
+
+# Stroke solver for an operator run. On redo, the strokes stored by the first run that read
+# from the same stroke source are reused (and solved targets come from the cache), even if
+# they were cleared since. A source not read yet is read now. Undo in Object and Pose mode
+# brings cleared strokes back, so reused ones are cleared again if they are there.
+# view and annotations default to the 3D viewport and the scene annotations.
+# Returns None if there is no stroke, or none of it is in front of the view.
+def solver_for_operator(op, context, view=None, annotations=None):
+    key_property = "all_strokes_key" if op.stroke_source == 'ALL' else "stroke_key"
+    key = getattr(op, key_property)
+    strokes_world = stroke_solver.load_strokes(key)
+    if strokes_world is not None:
+        clear_matching_strokes(context, strokes_world, annotations)
+    else:
+        with profiling.stage("read strokes") as stage:
+            if op.stroke_source == 'ALL':
+                strokes_world = gpencil_all_strokes_points(context, annotations)
+            else:
+                stroke_world = gpencil_stroke_points(context, annotations)
+                strokes_world = [stroke_world] if stroke_world is not None else []
+            stage.count = sum(len(stroke) for stroke in strokes_world)
+        if not strokes_world:
+            return None
+        key = stroke_solver.store_strokes(strokes_world)
+        setattr(op, key_property, key)
+
+    if view is None:
+        view = view_projection.ViewProjection.from_context(context)
+    solver = stroke_solver.StrokeSolver(view, strokes_world, op.projection, key, stroke_filter_for_operator(op))
+    # Strokes entirely behind a perspective view leave nothing to align to.
+    if not solver.polylines:
+        return None
+    return solver
+
+
+def stroke_filter_for_operator(op):
+    return stroke_preprocess.StrokeFilter(op.simplify_tolerance, op.resample_spacing, op.smooth_iterations, op.max_stroke_points)
+
+
+# World-space points (N, 3) of the last annotation stroke, or None if there is none.
+# Reads the scene annotations unless other annotation data is given. The stroke is
+# removed afterwards if the addon is set to clear strokes, unless clear is False.
+def gpencil_stroke_points(context, annotations=None, clear=True):
+    if annotations is None:
+        annotations = context.scene.grease_pencil
+    if not check_if_gp_has_strokes(annotations):
+        return None
+
+    gp = annotations.layers[-1].active_frame
+    stroke = gp.strokes[-1]
+    if len(stroke.points) == 0:
+        return None
+    points_world_3d = stroke_points(stroke)
+
+    if clear and context.preferences.addons[__package__].preferences.clear_strokes:
+        gp.strokes.remove(stroke)
+
+    return points_world_3d
+
+
+# World-space points of every stroke on the visible annotation layers, as a list of (N, 3) arrays.
+# Clearing works like in gpencil_stroke_points.
+def gpencil_all_strokes_points(context, annotations=None, clear=True):
+    if annotations is None:
+        annotations = context.scene.grease_pencil
+    if annotations is None:
+        return []
+
+    strokes_world = []
+    used = []
+    for layer in annotations.layers:
+        if layer.hide or layer.active_frame is None:
+            continue
+        for stroke in layer.active_frame.strokes:
+            if len(stroke.points) > 0:
+                strokes_world.append(stroke_points(stroke))
+                used.append((layer.active_frame, stroke))
+
+    if clear and context.preferences.addons[__package__].preferences.clear_strokes:
+        for frame, stroke in reversed(used):
+            frame.strokes.remove(stroke)
+
+    return strokes_world
+
+
+# Removes the annotation strokes on visible layers whose points are those of one of
+# strokes_world (a list of (N, 3) arrays), if the addon is set to clear strokes.
+def clear_matching_strokes(context, strokes_world, annotations=None):
+    if annotations is None:
+        annotations = context.scene.grease_pencil
+    if annotations is None or not context.preferences.addons[__package__].preferences.clear_strokes:
+        return
+
+    counts = {len(stroke) for stroke in strokes_world}
+    for layer in annotations.layers:
+        if layer.hide or layer.active_frame is None:
+            continue
+        strokes = layer.active_frame.strokes
+        matching = [stroke for stroke in strokes if len(stroke.points) in counts and
+                    any(np.array_equal(stroke_points(stroke), stroke_world) for stroke_world in strokes_world)]
+        for stroke in reversed(matching):
+            strokes.remove(stroke)
+
+
+# A stroke's points (N, 3), read in one go.
+def stroke_points(stroke):
+    points_world_3d = np.empty(len(stroke.points) * 3, dtype=np.float32)
+    stroke.points.foreach_get("co", points_world_3d)
+    return points_world_3d.reshape(-1, 3).astype(np.float64)
+
+
+# Screen positions (N, 2) of the last annotation stroke, cleaned up by stroke_filter if given.
+def gpencil_to_screenpos(context, view=None, stroke_filter=None, clear=True):
+    if view is None:
+        view = view_projection.ViewProjection.from_context(context)
+    points_world_3d = gpencil_stroke_points(context, clear=clear)
+    if points_world_3d is None:
+        return np.empty((0, 2))
+
+    points_2d = view.to_region(points_world_3d)
+    # Stroke points behind the view can't be used.
+    points_2d = points_2d[~np.isnan(points_2d).any(axis=1)]
+    if stroke_filter is not None:
+        points_2d = stroke_filter.apply(points_2d)
+    return points_2d
+
+
+def check_if_any_gp_exists(context):
+    return check_if_scene_gp_exists(context)
+
+
+def check_if_scene_gp_exists(context):
+    return check_if_gp_has_strokes(context.scene.grease_pencil)
+
+
+def check_if_gp_has_strokes(gps):
+    if(gps is not None):
+        if(len(gps.layers)>0):
+            if(len(gps.layers[-1].active_frame.strokes) > 0):
+                return True
+
+    return False
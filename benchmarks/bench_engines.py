@@ -0,0 +1,349 @@
+# End to end and per stage timings of the alignment engines on synthetic scenes,
+# written as JSON so runs of different addon versions can be compared.
+#
+# Runs headless, no GPU or window needed:
+#   blender --background --factory-startup --python benchmarks/bench_engines.py -- --output results.json
+#
+# Options (after the "--"):
+#   --output PATH   where to write the JSON results (default: print them)
+#   --quick         smaller scenes, for a quick check
+#   --repeats N     runs per measurement, the fastest one is kept (default: 3)
+#
+# There is no 3D viewport in background mode, so the view is a fake region and
+# region_3d, and the engines get a context proxy that answers what the screen
+# context would (objects_in_mode, selected_objects, ...).
+
+import datetime
+import importlib
+import json
+import math
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import bmesh
+import bpy
+import numpy as np
+from mathutils import Matrix
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(ADDON_DIR))
+addon = importlib.import_module(os.path.basename(ADDON_DIR))
+align = importlib.import_module(addon.__name__ + ".align")
+
+# (name, sizes) of each sweep. Every sweep varies one size and keeps the others at their middle value.
+GRID_SIZES = (32, 100, 316, 1000)            # 1k to 1M vertices
+STROKE_SIZES = (10, 100, 1000, 10000)         # stroke points
+CURVE_SIZES = ((10, 10), (100, 10), (100, 100), (1000, 100))   # (splines, points per spline)
+BONE_COUNTS = (10, 100, 1000)
+OBJECT_COUNTS = (100, 1000, 10000)
+
+QUICK_GRID_SIZES = (32, 100)
+QUICK_STROKE_SIZES = (10, 100)
+QUICK_CURVE_SIZES = ((10, 10), (100, 10))
+QUICK_BONE_COUNTS = (10, 100)
+QUICK_OBJECT_COUNTS = (100, 1000)
+
+MID_GRID_SIZE = 316
+MID_STROKE_SIZE = 1000
+QUICK_MID_GRID_SIZE = 100
+QUICK_MID_STROKE_SIZE = 100
+
+PROJECTIONS = ('AXIS', 'NEAREST')
+
+REGION_WIDTH = 1920
+REGION_HEIGHT = 1080
+
+
+class ContextProxy:
+    """Stands in for bpy.context: given attributes first, the real context for the rest"""
+
+    def __init__(self, **overrides):
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name):
+        return getattr(bpy.context, name)
+
+
+# Fake region and region_3d: a perspective view from -Y looking at the origin.
+def fake_view():
+    view_matrix = (Matrix.Translation((0.0, -10.0, 0.0)) @ Matrix.Rotation(math.radians(90.0), 4, 'X')).inverted()
+
+    aspect = REGION_WIDTH / REGION_HEIGHT
+    near, far = 0.1, 1000.0
+    focal = 1.0 / math.tan(math.radians(50.0) / 2.0)
+    window_matrix = Matrix((
+        (focal / aspect, 0.0, 0.0, 0.0),
+        (0.0, focal, 0.0, 0.0),
+        (0.0, 0.0, (far + near) / (near - far), 2.0 * far * near / (near - far)),
+        (0.0, 0.0, -1.0, 0.0)))
+
+    region = SimpleNamespace(width=REGION_WIDTH, height=REGION_HEIGHT)
+    region_3d = SimpleNamespace(view_matrix=view_matrix, perspective_matrix=window_matrix @ view_matrix, is_perspective=True)
+    return region, region_3d
+
+
+# A wavy stroke across the view, in the XZ plane.
+def make_stroke(count):
+    x = np.linspace(-4.0, 4.0, count)
+    z = np.sin(x * 1.5) * 1.5
+    return np.stack((x, np.zeros(count), z), axis=1)
+
+
+def make_solver(view, stroke_size, projection):
+    # No cache key: every run solves from scratch.
+    return align.stroke_solver.StrokeSolver(view, [make_stroke(stroke_size)], projection)
+
+
+def reset_scene():
+    active = bpy.context.view_layer.objects.active
+    if active is not None and active.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    for obj in list(bpy.data.objects):
+        bpy.data.objects.remove(obj)
+    for collection in (bpy.data.meshes, bpy.data.curves, bpy.data.armatures, bpy.data.actions):
+        for block in list(collection):
+            collection.remove(block)
+
+
+def enter_edit_mode(obj):
+    bpy.context.view_layer.objects.active = obj
+    obj.select_set(True)
+    bpy.ops.object.mode_set(mode='EDIT')
+
+
+def link(name, data):
+    obj = bpy.data.objects.new(name, data)
+    bpy.context.scene.collection.objects.link(obj)
+    return obj
+
+
+def make_grid(size):
+    mesh = bpy.data.meshes.new("Grid")
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments=size, y_segments=size, size=4.0)
+    # Stand the grid up to face the view, and select everything.
+    bmesh.ops.rotate(bm, verts=bm.verts, matrix=Matrix.Rotation(math.radians(90.0), 3, 'X'))
+    for v in bm.verts:
+        v.select = True
+    bm.to_mesh(mesh)
+    bm.free()
+    obj = link("Grid", mesh)
+    enter_edit_mode(obj)
+    return obj
+
+
+def make_curve(spline_count, point_count):
+    curve = bpy.data.curves.new("Curve", 'CURVE')
+    curve.dimensions = '3D'
+    x = np.linspace(-4.0, 4.0, point_count)
+    for i in range(spline_count):
+        z = (i / max(spline_count - 1, 1) - 0.5) * 6.0
+        # Every other spline is a poly spline, so both kinds are measured.
+        if i % 2 == 0:
+            spline = curve.splines.new('BEZIER')
+            spline.bezier_points.add(point_count - 1)
+            co = np.stack((x, np.zeros(point_count), np.full(point_count, z)), axis=1)
+            spline.bezier_points.foreach_set("co", co.astype(np.float32).ravel())
+            spline.bezier_points.foreach_set("handle_left", (co - (0.1, 0.0, 0.0)).astype(np.float32).ravel())
+            spline.bezier_points.foreach_set("handle_right", (co + (0.1, 0.0, 0.0)).astype(np.float32).ravel())
+            spline.bezier_points.foreach_set("select_control_point", np.ones(point_count, dtype=bool))
+        else:
+            spline = curve.splines.new('POLY')
+            spline.points.add(point_count - 1)
+            co = np.stack((x, np.zeros(point_count), np.full(point_count, z), np.ones(point_count)), axis=1)
+            spline.points.foreach_set("co", co.astype(np.float32).ravel())
+            spline.points.foreach_set("select", np.ones(point_count, dtype=bool))
+    obj = link("Curve", curve)
+    enter_edit_mode(obj)
+    return obj
+
+
+def make_armature(bone_count):
+    armature = bpy.data.armatures.new("Armature")
+    obj = link("Armature", armature)
+    enter_edit_mode(obj)
+    # One long connected chain (a tail), across the view.
+    length = 8.0 / bone_count
+    parent = None
+    for i in range(bone_count):
+        bone = armature.edit_bones.new("Bone%d" % i)
+        bone.head = (-4.0 + i * length, 0.0, 0.0)
+        bone.tail = (-4.0 + (i + 1) * length, 0.0, 0.0)
+        bone.parent = parent
+        bone.use_connect = parent is not None
+        bone.select = bone.select_head = bone.select_tail = True
+        parent = bone
+    return obj
+
+
+def make_objects(count):
+    rng = np.random.default_rng(0)
+    locations = rng.uniform(-4.0, 4.0, (count, 3))
+    locations[:, 1] = 0.0
+    objects = []
+    for i, location in enumerate(locations.tolist()):
+        obj = link("Prop%d" % i, None)
+        obj.location = location
+        objects.append(obj)
+    bpy.context.view_layer.update()
+    return objects
+
+
+# Fastest of `repeats` runs of func, in milliseconds.
+def timed(func, repeats):
+    best = math.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e3
+
+
+def bench_vertices(view, grid_size, stroke_size, projection, repeats):
+    obj = make_grid(grid_size)
+    context = ContextProxy(objects_in_mode=[obj])
+    solver = make_solver(view, stroke_size, projection)
+    bm = bmesh.from_edit_mesh(obj.data)
+    transform = align.transforms.ObjectTransform(obj.matrix_world)
+
+    indices, verts_local_3d = align.mesh_io.read_selected_vertices(obj)
+    verts_world_3d = transform.to_world(verts_local_3d)
+    newcoords = transform.to_local(solver.solve(verts_world_3d))
+    moved = align.mesh_io.write_vertices(bm, indices, newcoords)
+
+    stages = {
+        "read": timed(lambda: align.mesh_io.read_selected_vertices(obj), repeats),
+        "solve": timed(lambda: solver.solve(verts_world_3d), repeats),
+        "write": timed(lambda: align.mesh_io.write_vertices(bm, indices, newcoords), repeats),
+        "normals": timed(lambda: align.mesh_io.update_normals(moved), repeats),
+        "update_edit_mesh": timed(lambda: bmesh.update_edit_mesh(obj.data, False, False), repeats),
+    }
+    total = timed(lambda: align.align_vertices(context, 1.0, solver), repeats)
+    return {"verts": len(bm.verts), "selected": len(indices), "total": total, "stages": stages}
+
+
+def bench_curves(view, spline_count, point_count, stroke_size, projection, repeats):
+    obj = make_curve(spline_count, point_count)
+    context = ContextProxy(objects_in_mode=[obj])
+    solver = make_solver(view, stroke_size, projection)
+    splines = list(obj.data.splines)
+
+    def read():
+        for spline in splines:
+            if spline.type == 'BEZIER':
+                align.curve_io.read_bezier_points(spline)
+            else:
+                align.curve_io.read_spline_points(spline)
+
+    bezier = [align.curve_io.read_bezier_points(spline) for spline in splines if spline.type == 'BEZIER']
+    co_world = np.concatenate([co for _, co, _, _ in bezier])
+    left_world = np.concatenate([left for _, _, left, _ in bezier])
+    right_world = np.concatenate([right for _, _, _, right in bezier])
+    newco_world = solver.solve(co_world)
+
+    stages = {
+        "read": timed(read, repeats),
+        "solve": timed(lambda: solver.solve(co_world), repeats),
+        "handles": timed(lambda: align.solve_bezier_handles(solver, co_world, newco_world, left_world, right_world), repeats),
+    }
+    total = timed(lambda: align.align_curves(context, 1.0, solver), repeats)
+    return {"splines": spline_count, "points": spline_count * point_count, "total": total, "stages": stages}
+
+
+def bench_bones(view, bone_count, stroke_size, projection, repeats):
+    obj = make_armature(bone_count)
+    context = ContextProxy(edit_object=obj)
+    solver = make_solver(view, stroke_size, projection)
+    joints = np.array([b.head for b in obj.data.edit_bones] + [b.tail for b in obj.data.edit_bones])
+
+    stages = {"solve": timed(lambda: solver.solve(joints), repeats)}
+    total = timed(lambda: align.align_bones_editmode(context, 1.0, solver), repeats)
+    return {"bones": bone_count, "total": total, "stages": stages}
+
+
+def bench_objects(view, object_count, stroke_size, projection, repeats):
+    objects = make_objects(object_count)
+    context = ContextProxy(selected_editable_objects=objects)
+    solver = make_solver(view, stroke_size, projection)
+    origins = np.array([obj.matrix_world.translation for obj in objects])
+
+    stages = {
+        "solve": timed(lambda: solver.solve(origins), repeats),
+        "keyframes": timed(lambda: align.insert_location_keyframes(objects, 1), repeats),
+    }
+    total = timed(lambda: align.align_objects(context, 1.0, solver), repeats)
+    return {"objects": object_count, "total": total, "stages": stages}
+
+
+def run(quick, repeats):
+    region, region_3d = fake_view()
+    view = align.view_projection.ViewProjection.from_region(region, region_3d)
+
+    grid_sizes = QUICK_GRID_SIZES if quick else GRID_SIZES
+    stroke_sizes = QUICK_STROKE_SIZES if quick else STROKE_SIZES
+    mid_grid = QUICK_MID_GRID_SIZE if quick else MID_GRID_SIZE
+    mid_stroke = QUICK_MID_STROKE_SIZE if quick else MID_STROKE_SIZE
+
+    results = []
+
+    def record(engine, projection, stroke_size, func, *args):
+        reset_scene()
+        result = func(view, *args, stroke_size, projection, repeats)
+        result.update(engine=engine, projection=projection, stroke_points=stroke_size)
+        results.append(result)
+        print("%-10s %-8s stroke %6d  total %10.2f ms" % (engine, projection, stroke_size, result["total"]))
+
+    for projection in PROJECTIONS:
+        for grid_size in grid_sizes:
+            record("vertices", projection, mid_stroke, bench_vertices, grid_size)
+        for stroke_size in stroke_sizes:
+            record("vertices", projection, stroke_size, bench_vertices, mid_grid)
+        for spline_count, point_count in (QUICK_CURVE_SIZES if quick else CURVE_SIZES):
+            record("curves", projection, mid_stroke, bench_curves, spline_count, point_count)
+        for bone_count in (QUICK_BONE_COUNTS if quick else BONE_COUNTS):
+            record("bones", projection, mid_stroke, bench_bones, bone_count)
+        for object_count in (QUICK_OBJECT_COUNTS if quick else OBJECT_COUNTS):
+            record("objects", projection, mid_stroke, bench_objects, object_count)
+
+    reset_scene()
+    return {
+        "addon_version": ".".join(str(part) for part in addon.bl_info["version"]),
+        "blender_version": bpy.app.version_string,
+        "numpy_version": np.__version__,
+        "date": datetime.datetime.now().isoformat(timespec='seconds'),
+        "quick": quick,
+        "repeats": repeats,
+        "results": results,
+    }
+
+
+def parse_args(argv):
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    options = {"output": None, "quick": False, "repeats": 3}
+    args = iter(argv)
+    for arg in args:
+        if arg == "--output":
+            options["output"] = next(args)
+        elif arg == "--quick":
+            options["quick"] = True
+        elif arg == "--repeats":
+            options["repeats"] = max(int(next(args)), 1)
+    return options
+
+
+def main():
+    options = parse_args(sys.argv)
+    report = run(options["quick"], options["repeats"])
+    text = json.dumps(report, indent=2)
+    if options["output"]:
+        with open(options["output"], "w") as f:
+            f.write(text)
+        print("Results written to %s" % options["output"])
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
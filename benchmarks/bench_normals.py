@@ -0,0 +1,50 @@
+# Measures normal recalculation after aligning a fixed, small selection on
+# grids of growing size: the old full-mesh edge loop against mesh_io.update_normals.
+#
+# Needs bmesh, so run it with Blender:
+#   blender --background --factory-startup --python benchmarks/bench_normals.py
+
+import os
+import sys
+import time
+
+import bmesh
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mesh_io
+
+GRID_SIZES = (32, 100, 316, 1000, 1414)
+SELECTED_COUNT = 16
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    print("%10s %14s %14s" % ("verts", "all edges ms", "local ms"))
+    for size in GRID_SIZES:
+        bm = bmesh.new()
+        bmesh.ops.create_grid(bm, x_segments=size, y_segments=size, size=1.0)
+        bm.verts.ensure_lookup_table()
+
+        # A small patch in the middle of the grid, moved up a bit.
+        middle = len(bm.verts) // 2
+        moved = [bm.verts[middle + i] for i in range(SELECTED_COUNT)]
+        for v in moved:
+            v.co.z += 0.1
+
+        def all_edges():
+            for edge in bm.edges:
+                edge.normal_update()
+
+        full = timed(all_edges)
+        local = timed(lambda: mesh_io.update_normals(moved))
+        print("%10d %14.3f %14.3f" % (len(bm.verts), full * 1e3, local * 1e3))
+        bm.free()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Measures what enabling the addon costs at Blender startup: importing the package
+# and register(), in fresh Blender processes, against importing the engines (align)
+# on the first operator run. Fails if register() pulls in any engine module or NumPy,
+# which would put their import time on every launch.
+#
+# Run it with Blender:
+#   blender --background --factory-startup --python benchmarks/bench_startup.py
+#
+# Each sample is a new Blender process (module imports are only slow once per process),
+# so this takes a few seconds per run.
+
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import bpy
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADDON_NAME = os.path.basename(ADDON_DIR)
+
+RUNS = 5
+
+# Modules that must not be loaded by register(): the engines and what they import.
+ENGINE_MODULES = ("align", "curve_io", "live_stroke", "mesh_io", "mirror", "profiling", "proportional",
+                  "segment_index", "stroke_distribution", "stroke_preprocess", "stroke_projection",
+                  "stroke_solver", "surface_snap", "transforms", "view_projection")
+HEAVY_MODULES = ("numpy",) + tuple(ADDON_NAME + "." + name for name in ENGINE_MODULES)
+
+RESULT_PREFIX = "STARTUP_RESULT "
+
+
+# One sample, in this (fresh) process: prints the timings and the heavy modules register() loaded.
+def sample():
+    sys.path.insert(0, os.path.dirname(ADDON_DIR))
+    before = set(sys.modules)
+
+    start = time.perf_counter()
+    addon = importlib.import_module(ADDON_NAME)
+    imported = time.perf_counter()
+    # What addon_utils.enable does before register(), so the preferences exist.
+    addons = bpy.context.preferences.addons
+    if addons.get(ADDON_NAME) is None:
+        addons.new().module = ADDON_NAME
+    addon.register()
+    registered = time.perf_counter()
+
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules and name not in before]
+
+    start_first_run = time.perf_counter()
+    importlib.import_module(ADDON_NAME + ".align")
+    first_run = time.perf_counter() - start_first_run
+
+    addon.unregister()
+    print(RESULT_PREFIX + json.dumps({
+        "import": (imported - start) * 1e3,
+        "register": (registered - imported) * 1e3,
+        "first_run_import": first_run * 1e3,
+        "loaded_by_register": loaded,
+    }))
+
+
+def main():
+    samples = []
+    for _ in range(RUNS):
+        output = subprocess.run(
+            [bpy.app.binary_path, "--background", "--factory-startup", "--python", os.path.abspath(__file__), "--", "--sample"],
+            capture_output=True, text=True, check=True).stdout
+        line = next(line for line in output.splitlines() if line.startswith(RESULT_PREFIX))
+        samples.append(json.loads(line[len(RESULT_PREFIX):]))
+
+    print("%-20s %10s %10s" % ("", "median ms", "max ms"))
+    for key in ("import", "register", "first_run_import"):
+        values = [sample[key] for sample in samples]
+        print("%-20s %10.2f %10.2f" % (key, statistics.median(values), max(values)))
+
+    loaded = sorted({name for sample in samples for name in sample["loaded_by_register"]})
+    if loaded:
+        print("FAIL: register() loaded %s" % ", ".join(loaded))
+        sys.exit(1)
+    print("OK: register() loaded none of the engine modules")
+
+
+if __name__ == "__main__":
+    if "--sample" in sys.argv:
+        sample()
+    else:
+        main()
@@ -0,0 +1,58 @@
+# Micro-benchmark: local <-> world conversion of a 100k point selection,
+# per element with mathutils (the old per-vertex loop) against one batched ObjectTransform.
+#
+# Needs mathutils, so run it with Blender's Python:
+#   blender --background --factory-startup --python benchmarks/bench_transforms.py
+# or with any Python that has the standalone mathutils module installed.
+
+import os
+import sys
+import time
+
+import numpy as np
+from mathutils import Matrix, Vector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import transforms
+
+POINT_COUNT = 100000
+REPEATS = 3
+
+
+def best_of(func):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    coords = rng.normal(size=(POINT_COUNT, 3))
+    vectors = [Vector(co) for co in coords]
+    matrix_world = Matrix.Translation((1.0, 2.0, 3.0)) @ Matrix.Rotation(0.5, 4, 'Z') @ Matrix.Scale(2.0, 4)
+    depth = Vector((0.0, 0.0, 0.0))
+
+    # What align_vertices used to do for every vertex: world position in, local position out,
+    # with the inverse recomputed each time.
+    def per_element():
+        for co in vectors:
+            world = matrix_world @ co
+            local = matrix_world.inverted() @ (world + depth)
+            co.lerp(local, 1.0)
+
+    def batched():
+        transform = transforms.ObjectTransform(matrix_world)
+        world = transform.to_world(coords)
+        local = transform.to_local(world)
+        transforms.lerp(coords, local, 1.0)
+
+    for name, func in (("per element", per_element), ("batched", batched)):
+        seconds = best_of(func)
+        print("%-12s %8.1f ms total  %8.3f us/point" % (name, seconds * 1e3, seconds * 1e6 / POINT_COUNT))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Reading and writing curve spline points as arrays, one spline at a time.
+#
+# Everything goes through foreach_get/foreach_set on the spline's point
+# collection, so the cost doesn't depend on Python per point.
+
+import numpy as np
+
+
+# Selected rows, control points (N, 3) and left/right handles (N, 3) of a Bezier spline.
+def read_bezier_points(spline):
+    points = spline.bezier_points
+    select = _read(points, "select_control_point", 1, bool)
+    co = _read(points, "co", 3)
+    handle_left = _read(points, "handle_left", 3)
+    handle_right = _read(points, "handle_right", 3)
+    return np.flatnonzero(select), co, handle_left, handle_right
+
+
+# Selected rows and points (N, 4) of a poly or NURBS spline. The 4th component is the weight.
+def read_spline_points(spline):
+    points = spline.points
+    select = _read(points, "select", 1, bool)
+    return np.flatnonzero(select), _read(points, "co", 4)
+
+
+def write_bezier_points(spline, co, handle_left, handle_right):
+    points = spline.bezier_points
+    points.foreach_set("co", np.ascontiguousarray(co, dtype=np.float32).ravel())
+    points.foreach_set("handle_left", np.ascontiguousarray(handle_left, dtype=np.float32).ravel())
+    points.foreach_set("handle_right", np.ascontiguousarray(handle_right, dtype=np.float32).ravel())
+
+
+def write_spline_points(spline, co):
+    spline.points.foreach_set("co", np.ascontiguousarray(co, dtype=np.float32).ravel())
+
+
+def _read(collection, attr, width, dtype=np.float32):
+    values = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(attr, values)
+    if dtype is bool:
+        return values
+    return values.reshape(-1, width).astype(np.float64)
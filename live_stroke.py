@@ -0,0 +1,172 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Nearest-point solving against a stroke that keeps changing (live align).
+#
+# The stroke is split into blocks of consecutive segments, each with its own
+# segment_index.SegmentGrid. When the stroke changes, only the blocks from the
+# first changed point on are rebuilt. Vertices whose nearest segment was changed
+# are solved against the whole stroke again; all others only against the rebuilt
+# blocks. A new stroke (one changed from its first block on) is solved against
+# one grid over all of it instead, which is much faster than every block in turn.
+# Solving can be spread over several calls with a time budget.
+#
+# Like stroke_projection, this only depends on NumPy.
+
+import time
+
+import numpy as np
+
+from . import segment_index
+
+# Segments per block: the unit of reindexing.
+DEFAULT_BLOCK_SIZE = 256
+
+# Most vertices solved per pass, between two checks of the time budget.
+DEFAULT_CHUNK_SIZE = 4096
+
+# Vertices in the first pass under a time budget. Later passes are sized from how
+# long the previous ones took.
+FIRST_CHUNK_SIZE = 128
+
+
+class LiveStrokeIndex:
+    """Fixed screen-space vertices, solved incrementally against a changing stroke"""
+
+    def __init__(self, vertices_2d, block_size=DEFAULT_BLOCK_SIZE):
+        self.vertices = np.asarray(vertices_2d, dtype=np.float64).reshape(-1, 2)
+        self.block_size = max(int(block_size), 1)
+        count = len(self.vertices)
+
+        self.stroke = np.empty((0, 2))
+        self.blocks = []
+        # Grid over the whole stroke, for a new stroke. Built when first needed.
+        self.use_stroke_grid = False
+        self.stroke_grid = None
+
+        # Vertices off screen (NaN) are never solved.
+        self.visible = ~np.isnan(self.vertices).any(axis=1)
+
+        # Best match found so far for each vertex, and the first block it still has to be checked against.
+        self.closest = np.full((count, 2), np.nan)
+        self.best_segment = np.full(count, -1, dtype=np.intp)
+        self.best_distance = np.full(count, np.inf)
+        self.resolve_from = np.zeros(count, dtype=np.intp)
+
+    # Takes the current stroke (N, 2) and marks what has to be solved again.
+    # Returns False if the stroke did not change.
+    def update(self, stroke_2d):
+        stroke_2d = np.asarray(stroke_2d, dtype=np.float64).reshape(-1, 2)
+        common = min(len(stroke_2d), len(self.stroke))
+        changed = np.flatnonzero((stroke_2d[:common] != self.stroke[:common]).any(axis=1))
+        first_changed = int(changed[0]) if len(changed) else common
+        if first_changed == len(stroke_2d) == len(self.stroke):
+            return False
+
+        # Segment i runs from point i to point i + 1.
+        first_segment = max(first_changed - 1, 0)
+        first_block = first_segment // self.block_size
+        block_count = -(-max(len(stroke_2d) - 1, 1) // self.block_size) if len(stroke_2d) else 0
+
+        # Blocks share their end points, so the stroke stays connected across them.
+        self.blocks = self.blocks[:first_block]
+        for block in range(len(self.blocks), block_count):
+            start = block * self.block_size
+            self.blocks.append(segment_index.SegmentGrid.from_polyline(stroke_2d[start:start + self.block_size + 1]))
+        self.stroke = stroke_2d.copy()
+        self.use_stroke_grid = first_block == 0
+        self.stroke_grid = None
+
+        # Vertices whose nearest segment changed lose it and start over against the whole stroke.
+        lost = self.best_segment >= first_segment
+        self.closest[lost] = np.nan
+        self.best_segment[lost] = -1
+        self.best_distance[lost] = np.inf
+        self.resolve_from[lost] = 0
+        np.minimum(self.resolve_from, first_block, out=self.resolve_from)
+        return True
+
+    # Indices of the vertices that still have blocks to be checked against.
+    def pending(self):
+        return np.flatnonzero(self.visible & (self.resolve_from < len(self.blocks)))
+
+    # Solves pending vertices, chunk by chunk, until none are left or time_budget
+    # (seconds) is used up. Returns the indices of the vertices solved; their
+    # positions on the stroke are in self.closest.
+    def solve(self, time_budget=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        started = time.perf_counter()
+        pending = self.pending()
+        chunk_size = max(int(chunk_size), 1)
+        size = chunk_size if time_budget is None else min(FIRST_CHUNK_SIZE, chunk_size)
+
+        solved = []
+        start = 0
+        while start < len(pending):
+            indices = pending[start:start + size]
+            chunk_started = time.perf_counter()
+            self._solve_chunk(indices)
+            solved.append(indices)
+            start += len(indices)
+
+            if time_budget is not None:
+                now = time.perf_counter()
+                remaining = time_budget - (now - started)
+                if remaining <= 0.0:
+                    break
+                # Fit the next chunk into what is left of the budget.
+                per_vertex = max(now - chunk_started, 1e-9) / len(indices)
+                size = min(max(int(remaining / per_vertex), 1), chunk_size)
+
+        if not solved:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate(solved)
+
+    def _solve_chunk(self, indices):
+        resolve_from = self.resolve_from[indices]
+        self.resolve_from[indices] = len(self.blocks)
+
+        # Vertices with the whole of a new stroke to check go against one grid over all of it.
+        if self.use_stroke_grid:
+            fresh = resolve_from == 0
+            if fresh.any():
+                if self.stroke_grid is None:
+                    self.stroke_grid = segment_index.SegmentGrid.from_polyline(self.stroke)
+                self._solve_against(self.stroke_grid, 0, indices[fresh])
+                indices = indices[~fresh]
+                resolve_from = resolve_from[~fresh]
+            if len(indices) == 0:
+                return
+
+        for block in range(int(resolve_from.min()), len(self.blocks)):
+            self._solve_against(self.blocks[block], block * self.block_size, indices[resolve_from <= block])
+
+    # Keeps the nearer of each vertex's best match so far and its nearest segment in grid,
+    # whose first segment is first_segment of the stroke.
+    def _solve_against(self, grid, first_segment, subset):
+        best = self.best_distance[subset]
+        # Only segments at least as close as the best match so far are of interest,
+        # which lets the grid skip most of its cells for vertices that are already solved.
+        closest, segment, _, distance = grid.nearest(self.vertices[subset], max_distance=best)
+        segment += first_segment
+
+        # Ties go to the lowest segment, like SegmentGrid.nearest.
+        better = (distance < best) | ((distance == best) & (segment < self.best_segment[subset]))
+        subset = subset[better]
+        self.closest[subset] = closest[better]
+        self.best_segment[subset] = segment[better]
+        self.best_distance[subset] = distance[better]
@@ -0,0 +1,189 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Reading and writing edit-mode mesh vertices and UVs as arrays.
+#
+# Vertices are identified by their index, which is the same in the edit BMesh
+# and in the mesh datablock after Object.update_from_editmode(). UV loops are
+# identified by face index and corner, for the same reason.
+
+import numpy as np
+
+
+# Selected vertex indices and their local coordinates, read in bulk:
+# the edit mesh is flushed to the mesh datablock once, then selection flags
+# and coordinates come out of it with foreach_get.
+def read_selected_vertices(obj):
+    obj.update_from_editmode()
+    vertices = obj.data.vertices
+    count = len(vertices)
+
+    select = np.empty(count, dtype=bool)
+    vertices.foreach_get("select", select)
+    coords = np.empty(count * 3, dtype=np.float32)
+    vertices.foreach_get("co", coords)
+
+    indices = np.flatnonzero(select)
+    return indices, coords.reshape(-1, 3)[indices].astype(np.float64)
+
+
+# Local coordinates of every vertex (N, 3).
+# Pass flush=False if the edit mesh was just flushed by read_selected_vertices.
+def read_vertex_coords(obj, flush=True):
+    if flush:
+        obj.update_from_editmode()
+    vertices = obj.data.vertices
+    coords = np.empty(len(vertices) * 3, dtype=np.float32)
+    vertices.foreach_get("co", coords)
+    return coords.reshape(-1, 3).astype(np.float64)
+
+
+# Indices and local coordinates of the vertices that are neither selected nor hidden.
+# Pass flush=False if the edit mesh was just flushed by read_selected_vertices.
+def read_unselected_vertices(obj, flush=True):
+    if flush:
+        obj.update_from_editmode()
+    vertices = obj.data.vertices
+    count = len(vertices)
+
+    select = np.empty(count, dtype=bool)
+    vertices.foreach_get("select", select)
+    hide = np.empty(count, dtype=bool)
+    vertices.foreach_get("hide", hide)
+    coords = np.empty(count * 3, dtype=np.float32)
+    vertices.foreach_get("co", coords)
+
+    indices = np.flatnonzero(~select & ~hide)
+    return indices, coords.reshape(-1, 3)[indices].astype(np.float64)
+
+
+# Edges (E, 2) between selected vertices, as rows into indices (sorted vertex indices, as
+# returned by read_selected_vertices). Pass flush=False if the edit mesh was just flushed.
+def read_selected_edges(obj, indices, flush=True):
+    if flush:
+        obj.update_from_editmode()
+    edges = obj.data.edges
+    verts = np.empty(len(edges) * 2, dtype=np.int32)
+    edges.foreach_get("vertices", verts)
+    verts = verts.reshape(-1, 2)
+
+    if len(indices) == 0:
+        return np.empty((0, 2), dtype=np.intp)
+    rows = np.minimum(np.searchsorted(indices, verts), len(indices) - 1)
+    selected = (indices[rows] == verts).all(axis=1)
+    return rows[selected]
+
+
+# Same as read_selected_vertices, but walks the BMesh vertex by vertex.
+def scan_selected_vertices(bm):
+    selected = [(i, v.co) for i, v in enumerate(bm.verts) if v.select]
+    indices = np.array([i for i, _ in selected], dtype=np.intp)
+    coords = np.array([co for _, co in selected], dtype=np.float64).reshape(-1, 3)
+    return indices, coords
+
+
+# Writes new local coordinates for the given vertex indices into the BMesh.
+# Rows containing NaN are skipped. Returns the BMesh vertices that were moved.
+#
+# BMesh has no foreach_set, so this is one pass over the moved vertices only:
+# the rest of the mesh is never touched from Python.
+def write_vertices(bm, indices, coords):
+    solved = ~np.isnan(coords).any(axis=1)
+    bm.verts.ensure_lookup_table()
+    verts = bm.verts
+
+    moved = []
+    for index, co in zip(indices[solved].tolist(), coords[solved].tolist()):
+        v = verts[index]
+        v.co = co
+        moved.append(v)
+    return moved
+
+
+# Recalculates normals around the moved vertices only: the faces using them,
+# then every vertex of those faces (their normals depend on the face normals).
+def update_normals(moved_verts):
+    faces = {f for v in moved_verts for f in v.link_faces}
+    for f in faces:
+        f.normal_update()
+
+    verts = {v for f in faces for v in f.verts}
+    verts.update(moved_verts)
+    for v in verts:
+        v.normal_update()
+
+
+# Selected UV loops of the active UV layer, read in bulk like read_selected_vertices.
+# With uv_sync (UV sync selection), a loop is selected when its mesh vertex is.
+# Otherwise it needs its own UV selection flag and a selected face, since the UV
+# editor only shows the UVs of selected faces. Loops of hidden faces never count.
+# Returns (face indices, corners within the face, mesh vertex indices, UVs (N, 2)).
+def read_selected_uvs(obj, uv_sync=False):
+    obj.update_from_editmode()
+    mesh = obj.data
+    uv_layer = mesh.uv_layers.active
+    loop_count = len(mesh.loops)
+    face_count = len(mesh.polygons)
+
+    loop_start = np.empty(face_count, dtype=np.intp)
+    mesh.polygons.foreach_get("loop_start", loop_start)
+    loop_total = np.empty(face_count, dtype=np.intp)
+    mesh.polygons.foreach_get("loop_total", loop_total)
+    face_hide = np.empty(face_count, dtype=bool)
+    mesh.polygons.foreach_get("hide", face_hide)
+
+    loop_verts = np.empty(loop_count, dtype=np.intp)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+    uvs = np.empty(loop_count * 2, dtype=np.float32)
+    uv_layer.data.foreach_get("uv", uvs)
+
+    # Mesh loops are stored face after face, in face order.
+    loop_faces = np.repeat(np.arange(face_count), loop_total)
+    loop_corners = np.arange(loop_count) - np.repeat(loop_start, loop_total)
+
+    if uv_sync:
+        vert_select = np.empty(len(mesh.vertices), dtype=bool)
+        mesh.vertices.foreach_get("select", vert_select)
+        select = vert_select[loop_verts]
+    else:
+        face_select = np.empty(face_count, dtype=bool)
+        mesh.polygons.foreach_get("select", face_select)
+        select = np.empty(loop_count, dtype=bool)
+        uv_layer.data.foreach_get("select", select)
+        select &= face_select[loop_faces]
+    select &= ~face_hide[loop_faces]
+
+    loops = np.flatnonzero(select)
+    return loop_faces[loops], loop_corners[loops], loop_verts[loops], uvs.reshape(-1, 2)[loops].astype(np.float64)
+
+
+# Writes new UVs to the active UV layer of the BMesh, for the loops given by face
+# index and corner. Rows containing NaN are skipped. Returns the number of loops written.
+#
+# Like write_vertices, this only visits the loops that move.
+def write_uvs(bm, faces, corners, coords):
+    solved = ~np.isnan(coords).any(axis=1)
+    uv_layer = bm.loops.layers.uv.verify()
+    bm.faces.ensure_lookup_table()
+    bm_faces = bm.faces
+
+    count = 0
+    for face, corner, uv in zip(faces[solved].tolist(), corners[solved].tolist(), coords[solved].tolist()):
+        bm_faces[face].loops[corner][uv_layer].uv = uv
+        count += 1
+    return count
@@ -0,0 +1,150 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# X-mirror editing: which vertex is the mirror of which, across local X = 0.
+#
+# Like Blender's own mirror lookup, a vertex's mirror is the vertex nearest to its
+# mirrored position, within MIRROR_EPSILON. Vertices are hashed by the grid cell
+# they are in, and each mirrored position looks up its cell (and the neighbouring
+# ones it is within tolerance of). Maps are kept per mesh until its topology
+# changes: aligning moves both halves the same way, so the pairs found on the
+# first run stay valid on later ones.
+
+import hashlib
+
+import numpy as np
+
+# Distance within which a vertex matches a mirrored position, in local units.
+MIRROR_EPSILON = 1e-4
+
+# Grid cells are this many tolerances wide, so a mirrored position only needs the
+# neighbouring cells on the sides it is within tolerance of.
+_CELL_SCALE = 8.0
+
+# Which neighbouring cells to look in, per axis: 0 for the position's own cell,
+# 1 for the neighbour on the side it is near.
+_CORNERS = np.array([(x, y, z) for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype=np.int64)
+
+# Multipliers mixing the three grid coordinates into one hash.
+_HASH_FACTORS = np.array((73856093, 19349663, 83492791), dtype=np.int64)
+
+# (topology key, mirror map) by mesh name.
+_maps = {}
+
+
+# For each vertex position (N, 3), the index of the vertex nearest to its mirrored position
+# (-x, y, z) within epsilon, or -1 if there is none. Vertices on the mirror plane map to
+# themselves. Between equally near vertices (overlapping ones), the lowest index wins.
+def build_mirror_map(coords, epsilon=MIRROR_EPSILON):
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+    if len(coords) == 0:
+        return np.full(0, -1, dtype=np.intp)
+
+    # Overlapping vertices are matched once, as the lowest index among them, so a pile
+    # of them doesn't make a long run to step through for each.
+    # (Rows are compared as raw bytes, with -0.0 made 0.0 first.)
+    packed = np.ascontiguousarray(coords + 0.0).view(np.dtype((np.void, coords.itemsize * 3))).ravel()
+    _, lowest, inverse = np.unique(packed, return_index=True, return_inverse=True)
+    coords = coords[lowest]
+    mirror_map = np.full(len(coords), -1, dtype=np.intp)
+
+    cell = epsilon * _CELL_SCALE
+    hashes = _hash(np.floor(coords / cell).astype(np.int64))
+    order = np.argsort(hashes, kind='stable')
+    # Runs of equal hashes: vertices close together and hash collisions share one.
+    run_hashes, run_starts, run_counts = np.unique(hashes[order], return_index=True, return_counts=True)
+
+    mirrored = coords * np.array((-1.0, 1.0, 1.0))
+    scaled = mirrored / cell
+    mirrored_keys = np.floor(scaled).astype(np.int64)
+    fraction = scaled - mirrored_keys
+    side = np.where(fraction < 1.0 / _CELL_SCALE, -1, np.where(fraction >= 1.0 - 1.0 / _CELL_SCALE, 1, 0))
+
+    best = np.full(len(coords), np.inf)
+    for corner in _CORNERS:
+        # Only positions near a cell side on every axis this corner moves along look there.
+        rows = np.flatnonzero(((side != 0) | (corner == 0)).all(axis=1))
+        cell_hashes = _hash(mirrored_keys[rows] + side[rows] * corner)
+        runs = np.minimum(np.searchsorted(run_hashes, cell_hashes), len(run_hashes) - 1)
+        found = run_hashes[runs] == cell_hashes
+        rows, runs = rows[found], runs[found]
+        first = run_starts[runs]
+        last = first + run_counts[runs]
+
+        # Every vertex in the run is checked by distance.
+        step = 0
+        while True:
+            more = first + step < last
+            rows, first, last = rows[more], first[more], last[more]
+            if len(rows) == 0:
+                break
+            candidates = order[first + step]
+            distance = np.linalg.norm(coords[candidates] - mirrored[rows], axis=1)
+            better = (distance <= epsilon) & ((distance < best[rows]) | ((distance == best[rows]) & (lowest[candidates] < lowest[mirror_map[rows]])))
+            best[rows[better]] = distance[better]
+            mirror_map[rows[better]] = candidates[better]
+            step += 1
+
+    found = mirror_map >= 0
+    mirror_map[found] = lowest[mirror_map[found]]
+    return mirror_map[inverse.ravel()]
+
+
+# Mirror map of a mesh, from the cache when its topology is unchanged.
+# coords are all its vertex positions (N, 3); the mesh must be up to date with the
+# edit mesh (Object.update_from_editmode).
+def get_mirror_map(mesh, coords):
+    edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edges)
+    key = (len(mesh.vertices), hashlib.blake2b(edges.tobytes(), digest_size=16).hexdigest())
+
+    cached = _maps.get(mesh.name)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    mirror_map = build_mirror_map(coords)
+    _maps[mesh.name] = (key, mirror_map)
+    return mirror_map
+
+
+# Counterparts of the moved vertices (indices, from their positions in coords to
+# new_coords, all local) and where they go: the same displacement with X flipped.
+# Counterparts that are moved themselves, or are their own mirror, are left out.
+# Returns (vertex indices, new local coordinates).
+def mirror_displacement(mirror_map, coords, indices, new_coords):
+    counterparts = mirror_map[indices]
+    usable = (counterparts >= 0) & (counterparts != indices) & ~np.isin(counterparts, indices)
+    usable &= ~np.isnan(new_coords).any(axis=1)
+
+    # Two moved vertices can share a counterpart (overlapping vertices); the first one wins.
+    rows = np.flatnonzero(usable)
+    counterparts, first = np.unique(counterparts[rows], return_index=True)
+    rows = rows[first]
+
+    displacement = new_coords[rows] - coords[indices[rows]]
+    displacement[:, 0] *= -1.0
+    return counterparts, coords[counterparts] + displacement
+
+
+def _hash(keys):
+    mixed = keys * _HASH_FACTORS
+    return mixed[:, 0] ^ mixed[:, 1] ^ mixed[:, 2]
+
+
+def clear():
+    _maps.clear()
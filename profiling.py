@@ -0,0 +1,127 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Opt-in timing of operator runs, stage by stage, turned on in the addon preferences.
+#
+# An operator wraps its run in run(); code anywhere below it marks its stages
+# with stage(). Stages record wall time and how many elements they went
+# through, and can nest. Outside of a profiled run, stage() does nothing.
+
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager
+
+# Functions printed to the console from cProfile's statistics.
+STATS_LINES = 25
+
+# The run being profiled, if any.
+_active = None
+
+
+class Stage:
+    """Wall time and element count of one stage of a run"""
+
+    def __init__(self, name, depth, count=None):
+        self.name = name
+        self.depth = depth
+        self.count = count
+        self.seconds = 0.0
+
+
+class RunProfile:
+    """Stages of one operator run, in the order they started"""
+
+    def __init__(self, name, use_cprofile=False):
+        self.name = name
+        self.stages = []
+        self.depth = 0
+        self.seconds = 0.0
+        self.profiler = cProfile.Profile() if use_cprofile else None
+
+    # One line for the info bar: the total and the outermost stages.
+    def summary(self):
+        stages = ", ".join("%s %.1f ms" % (stage.name, stage.seconds * 1e3) for stage in self.stages if stage.depth == 0)
+        return "%s: %.1f ms (%s)" % (self.name, self.seconds * 1e3, stages)
+
+    # Every stage, indented by nesting, with counts. Followed by cProfile's top functions if it ran.
+    def table(self):
+        lines = ["%s: %.2f ms" % (self.name, self.seconds * 1e3)]
+        for stage in self.stages:
+            label = "  " * (stage.depth + 1) + stage.name
+            count = "" if stage.count is None else "%10d" % stage.count
+            lines.append("%-36s %10.2f ms %s" % (label, stage.seconds * 1e3, count))
+
+        if self.profiler is not None:
+            stream = io.StringIO()
+            pstats.Stats(self.profiler, stream=stream).sort_stats("cumulative").print_stats(STATS_LINES)
+            lines.append(stream.getvalue())
+        return "\n".join(lines)
+
+
+# Stand-in handed out by stage() when nothing is profiled, so callers can set its count regardless.
+_unused = Stage("", 0)
+
+
+# Profiles the run of an operator if the addon preferences ask for it, then reports the
+# summary to the operator (info bar) and the full table to the system console.
+# Runs inside a profiled run are part of it.
+@contextmanager
+def run(op, context):
+    global _active
+    prefs = context.preferences.addons[__package__].preferences
+    if not prefs.profile_runs or _active is not None:
+        yield
+        return
+
+    profile = RunProfile(op.bl_idname, prefs.use_cprofile)
+    _active = profile
+    if profile.profiler is not None:
+        profile.profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.seconds = time.perf_counter() - start
+        if profile.profiler is not None:
+            profile.profiler.disable()
+        _active = None
+
+    op.report({'INFO'}, profile.summary())
+    print(profile.table())
+
+
+# Times a stage of the current run. The yielded Stage's count can be set inside the block,
+# when it's only known there.
+@contextmanager
+def stage(name, count=None):
+    profile = _active
+    if profile is None:
+        yield _unused
+        return
+
+    record = Stage(name, profile.depth, count)
+    profile.stages.append(record)
+    profile.depth += 1
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - start
+        profile.depth -= 1
@@ -0,0 +1,178 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Proportional editing: unselected vertices near the aligned ones follow their
+# displacement, weighted by the falloff of the scene's proportional settings.
+#
+# Like Blender's own proportional transform, each affected vertex follows its
+# nearest moved vertex, either in space (KD-tree over the moved vertices) or
+# along the mesh edges (shortest paths over the BMesh, for connected only).
+
+import heapq
+
+import numpy as np
+from mathutils import Matrix, kdtree
+
+from . import mesh_io
+
+
+class ProportionalSettings:
+    """Proportional editing settings, read from the scene's tool settings"""
+
+    def __init__(self, radius, falloff='SMOOTH', connected=False, projected=False):
+        self.radius = float(radius)
+        self.falloff = falloff
+        self.connected = bool(connected)
+        self.projected = bool(projected)
+
+    # Settings from the scene, or None when proportional editing is off.
+    @classmethod
+    def from_context(cls, context):
+        ts = context.scene.tool_settings
+        if not ts.use_proportional_edit:
+            return None
+        return cls(ts.proportional_size, ts.proportional_edit_falloff, ts.use_proportional_connected, ts.use_proportional_projected)
+
+
+# Falloff weights for distance ratios (distance / radius, from 0 to 1).
+# Same curves as Blender's proportional editing.
+def falloff_weights(falloff, ratio):
+    rest = 1.0 - np.clip(np.asarray(ratio, dtype=np.float64), 0.0, 1.0)
+    if falloff == 'SHARP':
+        return rest * rest
+    if falloff == 'SMOOTH':
+        return 3.0 * rest * rest - 2.0 * rest * rest * rest
+    if falloff == 'ROOT':
+        return np.sqrt(rest)
+    if falloff == 'SPHERE':
+        return np.sqrt(np.maximum(2.0 * rest - rest * rest, 0.0))
+    if falloff == 'INVERSE_SQUARE':
+        return rest * (2.0 - rest)
+    if falloff == 'CONSTANT':
+        return np.ones_like(rest)
+    if falloff == 'RANDOM':
+        return rest * np.random.random_sample(rest.shape)
+    return rest
+
+
+# For each candidate point (N, 3), the nearest source point (M, 3) within radius.
+# Returns (candidate rows, source rows, distances). With view_axis, distances are
+# measured across the view only (projected proportional editing).
+def nearest_sources(sources, candidates, radius, view_axis=None):
+    sources = np.asarray(sources, dtype=np.float64).reshape(-1, 3)
+    candidates = np.asarray(candidates, dtype=np.float64).reshape(-1, 3)
+    if view_axis is not None:
+        axis = np.asarray(view_axis, dtype=np.float64) / np.linalg.norm(view_axis)
+        sources = sources - np.outer(sources @ axis, axis)
+        candidates = candidates - np.outer(candidates @ axis, axis)
+
+    empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0))
+    if len(sources) == 0 or len(candidates) == 0:
+        return empty
+
+    # Only candidates inside the sources' bounds grown by the radius are looked up.
+    low = sources.min(axis=0) - radius
+    high = sources.max(axis=0) + radius
+    rows = np.flatnonzero(((candidates >= low) & (candidates <= high)).all(axis=1))
+    if len(rows) == 0:
+        return empty
+
+    tree = kdtree.KDTree(len(sources))
+    for i, co in enumerate(sources.tolist()):
+        tree.insert(co, i)
+    tree.balance()
+
+    found_rows = []
+    found_sources = []
+    found_distances = []
+    for row, co in zip(rows.tolist(), candidates[rows].tolist()):
+        _, source, distance = tree.find(co)
+        if distance <= radius:
+            found_rows.append(row)
+            found_sources.append(source)
+            found_distances.append(distance)
+
+    return np.array(found_rows, dtype=np.intp), np.array(found_sources, dtype=np.intp), np.array(found_distances)
+
+
+# Shortest paths along the edges of a BMesh, from the source vertices (by index) out
+# to radius, with edge lengths measured after matrix (usually the world matrix).
+# Returns (vertex indices, source rows, distances) for the vertices reached, sources excluded.
+# Hidden vertices are not walked through.
+def connected_sources(bm, source_indices, radius, matrix):
+    bm.verts.ensure_lookup_table()
+    bm.verts.index_update()
+    verts = bm.verts
+    linear = Matrix(np.asarray(matrix, dtype=np.float64)[:3, :3].tolist())
+
+    best = {}
+    origin = {}
+    queue = []
+    for row, index in enumerate(np.asarray(source_indices).tolist()):
+        best[index] = 0.0
+        origin[index] = row
+        queue.append((0.0, index))
+    heapq.heapify(queue)
+
+    while queue:
+        distance, index = heapq.heappop(queue)
+        if distance > best[index]:
+            continue
+        v = verts[index]
+        for edge in v.link_edges:
+            other = edge.other_vert(v)
+            if other.hide:
+                continue
+            reach = distance + (linear @ (other.co - v.co)).length
+            other_index = other.index
+            if reach <= radius and reach < best.get(other_index, np.inf):
+                best[other_index] = reach
+                origin[other_index] = origin[index]
+                heapq.heappush(queue, (reach, other_index))
+
+    sources = set(np.asarray(source_indices).tolist())
+    reached = [index for index in best if index not in sources]
+    return (np.array(reached, dtype=np.intp),
+            np.array([origin[index] for index in reached], dtype=np.intp),
+            np.array([best[index] for index in reached]))
+
+
+# New local coordinates for the unselected vertices of a mesh in edit mode that follow
+# the selected ones (indices, moved from old_coords to new_coords, all local).
+# Returns (vertex indices, new local coordinates). Selected vertices that were not
+# solved (NaN) stay put, and so do the vertices following them.
+def follow_selection(obj, bm, indices, old_coords, new_coords, settings, view_axis=None, flush=True):
+    displacement = np.nan_to_num(new_coords - old_coords)
+    radius = max(settings.radius, 1e-6)
+    matrix = np.array(obj.matrix_world, dtype=np.float64)
+
+    if settings.connected:
+        targets, sources, distances = connected_sources(bm, indices, radius, matrix)
+        bm.verts.ensure_lookup_table()
+        verts = bm.verts
+        target_coords = np.array([verts[index].co for index in targets.tolist()], dtype=np.float64).reshape(-1, 3)
+    else:
+        free_indices, free_coords = mesh_io.read_unselected_vertices(obj, flush)
+        old_world = old_coords @ matrix[:3, :3].T + matrix[:3, 3]
+        free_world = free_coords @ matrix[:3, :3].T + matrix[:3, 3]
+        rows, sources, distances = nearest_sources(old_world, free_world, radius, view_axis)
+        targets = free_indices[rows]
+        target_coords = free_coords[rows]
+
+    weights = falloff_weights(settings.falloff, distances / radius)
+    return targets, target_coords + displacement[sources] * weights[:, None]
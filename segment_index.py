@@ -0,0 +1,255 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Spatial index over 2D stroke segments, for true closest-point-on-polyline queries.
+#
+# Like stroke_projection, this only depends on NumPy.
+
+import math
+
+import numpy as np
+
+
+# Queries solved per NumPy pass. Bounds the size of the (query, cell) candidate arrays.
+DEFAULT_CHUNK_SIZE = 8192
+
+# Finest grid is at most 2^MAX_DEPTH cells on a side.
+MAX_DEPTH = 10
+
+# Up to this many segments, queries are checked against every segment: walking the
+# quadtree costs more than it saves on short strokes.
+BRUTE_FORCE_SEGMENTS = 200
+
+# Most (query, segment) pairs per NumPy pass when checking every segment.
+BRUTE_FORCE_PAIRS = 1 << 20
+
+
+class SegmentGrid:
+    """Grid of 2D segments with a quadtree pyramid on top, answering nearest point queries"""
+
+    def __init__(self, segment_starts, segment_ends):
+        self.starts = np.asarray(segment_starts, dtype=np.float64).reshape(-1, 2)
+        self.ends = np.asarray(segment_ends, dtype=np.float64).reshape(-1, 2)
+        if len(self.starts) == 0:
+            raise ValueError("No segments to index")
+
+        count = len(self.starts)
+        midpoints = (self.starts + self.ends) * 0.5
+        self.origin = midpoints.min(axis=0)
+        extent = float((midpoints.max(axis=0) - self.origin).max())
+
+        # About one leaf cell per segment. Cells are square.
+        self.depth = min(max(math.ceil(math.log(count, 4)), 0), MAX_DEPTH) if count > 1 else 0
+        side = 1 << self.depth
+        self.size = max(extent, 1e-6) * (1.0 + 1e-9)
+        self.leaf_size = self.size / side
+
+        # Every segment is filed under the leaf cell holding its midpoint (CSR layout),
+        # so an occupied cell always has a segment passing through its box. Each cell also
+        # records how far its segments reach out of it: the longest half-segment filed there.
+        leaf = np.clip(np.floor((midpoints - self.origin) / self.leaf_size).astype(np.intp), 0, side - 1)
+        leaf_ids = leaf[:, 0] * side + leaf[:, 1]
+        lengths = np.linalg.norm(self.ends - self.starts, axis=1) * 0.5
+
+        self.cell_segments = np.argsort(leaf_ids, kind='stable')
+        counts = np.bincount(leaf_ids, minlength=side * side)
+        self.cell_start = np.concatenate(([0], np.cumsum(counts)))
+
+        reach = np.zeros(side * side)
+        np.maximum.at(reach, leaf_ids, lengths)
+
+        # One point on a segment in each cell (a midpoint), NaN for empty cells.
+        anchor = np.full((side * side, 2), np.nan)
+        anchor[leaf_ids] = midpoints
+
+        # Pyramid of (occupied, reach, anchor) grids indexed [x, y], from the 1x1 root down to the leaves.
+        occupied = counts.reshape(side, side) > 0
+        reach = reach.reshape(side, side)
+        anchor = anchor.reshape(side, side, 2)
+        self.levels = [(occupied, reach, anchor)]
+        while side > 1:
+            side //= 2
+            occupied = occupied.reshape(side, 2, side, 2).any(axis=(1, 3))
+            reach = reach.reshape(side, 2, side, 2).max(axis=(1, 3))
+            children = anchor.reshape(side, 2, side, 2, 2).transpose(0, 2, 1, 3, 4).reshape(side, side, 4, 2)
+            first = np.argmax(~np.isnan(children[..., 0]), axis=2)
+            anchor = np.take_along_axis(children, first[..., None, None], axis=2)[:, :, 0]
+            self.levels.insert(0, (occupied, reach, anchor))
+
+    # Builds the index from one polyline, or from several (segments never bridge two polylines).
+    @classmethod
+    def from_polylines(cls, polylines):
+        starts = []
+        ends = []
+        for points in polylines:
+            points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+            if len(points) == 1:
+                # A lone point is kept as a zero-length segment.
+                points = np.concatenate((points, points))
+            starts.append(points[:-1])
+            ends.append(points[1:])
+        return cls(np.concatenate(starts), np.concatenate(ends))
+
+    @classmethod
+    def from_polyline(cls, points_2d):
+        return cls.from_polylines([points_2d])
+
+    def __len__(self):
+        return len(self.starts)
+
+    # Closest point on the indexed segments for each query point.
+    # Returns (points (N, 2), segment index (N,), parameter along the segment (N,), distance (N,)).
+    #
+    # With max_distance (a scalar or one value per query), segments farther away than that
+    # are not looked at. Queries with nothing in range get NaN points, segment -1 and an
+    # infinite distance.
+    def nearest(self, points_2d, chunk_size=DEFAULT_CHUNK_SIZE, max_distance=None):
+        points_2d = np.asarray(points_2d, dtype=np.float64).reshape(-1, 2)
+        count = len(points_2d)
+        closest = np.empty_like(points_2d)
+        segment = np.empty(count, dtype=np.intp)
+        factor = np.empty(count)
+        distance = np.empty(count)
+
+        if max_distance is None:
+            max_distance = np.inf
+        bound = np.broadcast_to(np.asarray(max_distance, dtype=np.float64) ** 2, (count,))
+
+        chunk_size = max(int(chunk_size), 1)
+        nearest_chunk = self._nearest_chunk
+        if len(self.starts) <= BRUTE_FORCE_SEGMENTS:
+            nearest_chunk = self._nearest_chunk_brute_force
+            chunk_size = min(chunk_size, max(BRUTE_FORCE_PAIRS // len(self.starts), 1))
+
+        for start in range(0, count, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            closest[chunk], segment[chunk], factor[chunk], distance[chunk] = nearest_chunk(points_2d[chunk], bound[chunk])
+
+        return closest, segment, factor, distance
+
+    # Same interface as stroke_projection.StrokeIndex.project.
+    def project(self, vertices_2d, chunk_size=DEFAULT_CHUNK_SIZE):
+        return self.nearest(vertices_2d, chunk_size)[0]
+
+    def _nearest_chunk(self, queries, bound):
+        count = len(queries)
+
+        # Candidate (query, cell) pairs, always kept grouped by query.
+        cand_query = np.arange(count)
+        cand_cell = np.zeros((count, 2), dtype=np.intp)
+
+        for level, (occupied, reach, anchor) in enumerate(self.levels):
+            if len(cand_query) == 0:
+                break
+            cell_size = self.size / (1 << level)
+            low = self.origin + cand_cell * cell_size
+            q = queries[cand_query]
+            cell_reach = reach[cand_cell[:, 0], cand_cell[:, 1]][:, None]
+
+            # The cell's anchor lies on one of its segments, which bounds the distance from above.
+            # Every segment filed in the cell passes through its box and stays within `reach` of it,
+            # so the grown box bounds it from below.
+            offset = q - anchor[cand_cell[:, 0], cand_cell[:, 1]]
+            upper = np.einsum('ij,ij->i', offset, offset)
+            gap = np.maximum(np.maximum(low - cell_reach - q, q - low - cell_size - cell_reach), 0.0)
+            lower = np.einsum('ij,ij->i', gap, gap)
+
+            group_start = np.flatnonzero(np.concatenate(([True], cand_query[1:] != cand_query[:-1])))
+            group_sizes = np.diff(np.append(group_start, len(cand_query)))
+            best_upper = np.repeat(np.minimum.reduceat(upper, group_start), group_sizes)
+            keep = lower <= np.minimum(best_upper, bound[cand_query])
+            cand_query = cand_query[keep]
+            cand_cell = cand_cell[keep]
+
+            if level + 1 < len(self.levels):
+                # Split every surviving cell into its occupied children.
+                child_occupied = self.levels[level + 1][0]
+                cand_query = np.repeat(cand_query, 4)
+                cand_cell = np.repeat(cand_cell, 4, axis=0) * 2 + np.tile(_CHILD_OFFSETS, (len(cand_cell), 1))
+                keep = child_occupied[cand_cell[:, 0], cand_cell[:, 1]]
+                cand_query = cand_query[keep]
+                cand_cell = cand_cell[keep]
+
+        # Exact distances to the segments of the surviving leaf cells.
+        side = 1 << self.depth
+        cell_ids = cand_cell[:, 0] * side + cand_cell[:, 1]
+        first = self.cell_start[cell_ids]
+        counts = self.cell_start[cell_ids + 1] - first
+        seg_query = np.repeat(cand_query, counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        seg_ids = self.cell_segments[np.repeat(first, counts) + local]
+
+        _, _, d2 = _closest_on_segments(queries[seg_query], self.starts[seg_ids], self.ends[seg_ids])
+
+        # Per query minimum, ties broken towards the lowest segment index.
+        # Segments beyond the query's bound don't count.
+        in_range = d2 <= bound[seg_query]
+        seg_query = seg_query[in_range]
+        seg_ids = seg_ids[in_range]
+        order = np.lexsort((seg_ids, d2[in_range], seg_query))
+        seg_query = seg_query[order]
+        first_of_query = np.ones(len(seg_query), dtype=bool)
+        first_of_query[1:] = seg_query[1:] != seg_query[:-1]
+        best_segment = np.full(count, -1, dtype=np.intp)
+        best_segment[seg_query[first_of_query]] = seg_ids[order][first_of_query]
+
+        return self._result(queries, best_segment)
+
+    # Same as _nearest_chunk, checking every segment.
+    def _nearest_chunk_brute_force(self, queries, bound):
+        count = len(queries)
+        # Squared distances (N, M) from every query to every segment, one coordinate at a time,
+        # with the same arithmetic as _closest_on_segments.
+        starts = self.starts
+        direction = self.ends - starts
+        length2 = np.einsum('ij,ij->i', direction, direction)
+        along = (queries[:, 0, None] - starts[:, 0]) * direction[:, 0] + (queries[:, 1, None] - starts[:, 1]) * direction[:, 1]
+        factor = np.clip(np.divide(along, length2, out=np.zeros_like(along), where=length2 > 0), 0.0, 1.0)
+        offset_x = queries[:, 0, None] - (starts[:, 0] + direction[:, 0] * factor)
+        offset_y = queries[:, 1, None] - (starts[:, 1] + direction[:, 1] * factor)
+        d2 = offset_x * offset_x + offset_y * offset_y
+
+        # argmin picks the lowest segment index among equally near ones.
+        best_segment = np.argmin(d2, axis=1)
+        best_segment[d2[np.arange(count), best_segment] > bound] = -1
+        return self._result(queries, best_segment)
+
+    # Closest points, parameters and distances for the best segment of each query (-1 for none).
+    def _result(self, queries, best_segment):
+        count = len(queries)
+        found = best_segment >= 0
+        closest = np.full_like(queries, np.nan)
+        factor = np.full(count, np.nan)
+        d2 = np.full(count, np.inf)
+        closest[found], factor[found], d2[found] = _closest_on_segments(queries[found], self.starts[best_segment[found]], self.ends[best_segment[found]])
+        return closest, best_segment, factor, np.sqrt(d2)
+
+
+_CHILD_OFFSETS = np.array(((0, 0), (0, 1), (1, 0), (1, 1)), dtype=np.intp)
+
+
+# Closest point on each segment (starts[i], ends[i]) to points[i].
+# Returns (closest points, parameter along the segment, squared distance).
+def _closest_on_segments(points, starts, ends):
+    direction = ends - starts
+    length2 = np.einsum('ij,ij->i', direction, direction)
+    along = np.einsum('ij,ij->i', points - starts, direction)
+    factor = np.clip(np.divide(along, length2, out=np.zeros_like(along), where=length2 > 0), 0.0, 1.0)
+    closest = starts + direction * factor[:, None]
+    offset = points - closest
+    return closest, factor, np.einsum('ij,ij->i', offset, offset)
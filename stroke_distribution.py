@@ -0,0 +1,177 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Spreading chains of elements (edge loops, bone chains, curve points) along a stroke
+# by arc length, instead of moving each element to its own nearest place on it.
+#
+# The stroke's cumulative arc length is tabulated once. Each element of a chain
+# gets a parameter (a fraction of the stroke's length) and is placed with a binary
+# search in the table, so placing N elements on an M point stroke is O(N log M).
+
+import numpy as np
+
+
+class ArcLengthTable:
+    """Cumulative arc length along a polyline (M, 2)"""
+
+    def __init__(self, points_2d):
+        self.points = np.asarray(points_2d, dtype=np.float64).reshape(-1, 2)
+        steps = np.linalg.norm(self.points[1:] - self.points[:-1], axis=1)
+        self.lengths = np.concatenate(([0.0], np.cumsum(steps)))
+        self.length = float(self.lengths[-1])
+
+    def __len__(self):
+        return len(self.points)
+
+    # Positions (N, 2) at fractions of the length (N,), clamped to [0, 1].
+    def positions(self, parameters):
+        parameters = np.asarray(parameters, dtype=np.float64).ravel()
+        if len(self.points) == 0:
+            return np.full((len(parameters), 2), np.nan)
+        if self.length <= 0.0:
+            return np.repeat(self.points[:1], len(parameters), axis=0)
+
+        distance = np.clip(parameters, 0.0, 1.0) * self.length
+        segment = np.clip(np.searchsorted(self.lengths, distance, side='right') - 1, 0, len(self.points) - 2)
+        start = self.lengths[segment]
+        span = self.lengths[segment + 1] - start
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(span > 0.0, (distance - start) / span, 0.0)
+        return self.points[segment] + (self.points[segment + 1] - self.points[segment]) * t[:, None]
+
+    # Fractions of the length (N,) at points given by segment index and factor along that segment.
+    def parameters(self, segment, factor):
+        segment = np.asarray(segment, dtype=np.intp)
+        if self.length <= 0.0:
+            return np.zeros(len(segment))
+        start = self.lengths[segment]
+        span = self.lengths[segment + 1] - start
+        return (start + span * np.asarray(factor, dtype=np.float64)) / self.length
+
+
+class Chain:
+    """Elements (rows into a batch of points) in the order they are spread along the stroke"""
+
+    def __init__(self, rows, closed=False, ordered=True):
+        self.rows = np.asarray(rows, dtype=np.intp)
+        self.closed = closed
+        # Unordered chains (branching edges, loose elements) are ordered by where they are along the stroke.
+        self.ordered = ordered
+
+    # The same chain, with rows moved by offset (for a batch concatenated from several objects).
+    def shifted(self, offset):
+        return Chain(self.rows + offset, self.closed, self.ordered)
+
+
+# Chains of count elements (rows 0 to count - 1) joined by edges (E, 2) of row pairs.
+# Paths and loops become ordered chains. Components that branch, and the elements
+# with no edges (all together), become unordered chains.
+def chains_from_edges(count, edges):
+    neighbours = [[] for _ in range(count)]
+    for a, b in np.asarray(edges, dtype=np.intp).reshape(-1, 2).tolist():
+        if a != b and b not in neighbours[a]:
+            neighbours[a].append(b)
+            neighbours[b].append(a)
+
+    chains = []
+    loose = []
+    seen = [False] * count
+    for root in range(count):
+        if seen[root]:
+            continue
+        seen[root] = True
+        if not neighbours[root]:
+            loose.append(root)
+            continue
+
+        component = [root]
+        stack = [root]
+        while stack:
+            for other in neighbours[stack.pop()]:
+                if not seen[other]:
+                    seen[other] = True
+                    component.append(other)
+                    stack.append(other)
+
+        if any(len(neighbours[row]) > 2 for row in component):
+            chains.append(Chain(component, ordered=False))
+            continue
+
+        # A path is walked from one of its ends, a loop from anywhere.
+        ends = [row for row in component if len(neighbours[row]) == 1]
+        start = ends[0] if ends else root
+        order = [start]
+        previous, current = -1, start
+        while True:
+            following = [row for row in neighbours[current] if row != previous]
+            if not following or following[0] == start:
+                break
+            previous, current = current, following[0]
+            order.append(current)
+        chains.append(Chain(order, closed=not ends))
+
+    if loose:
+        chains.append(Chain(loose, ordered=False))
+    return chains
+
+
+# Order (indices into points_2d) that lays a chain along the stroke the way it already
+# lies: an open chain starts at the end nearest the stroke's start, a closed one at its
+# element nearest the stroke's start, going round the way that follows the stroke.
+def orient(points_2d, closed, table):
+    count = len(points_2d)
+    order = np.arange(count)
+    start, end = table.positions((0.0, 1.0))
+    if not closed:
+        forward = np.linalg.norm(points_2d[0] - start) + np.linalg.norm(points_2d[-1] - end)
+        backward = np.linalg.norm(points_2d[0] - end) + np.linalg.norm(points_2d[-1] - start)
+        return order[::-1] if backward < forward else order
+
+    order = np.roll(order, -int(np.argmin(np.linalg.norm(points_2d - start, axis=1))))
+    reverse = np.concatenate((order[:1], order[:0:-1]))
+    # Which way round: compare the element a quarter of the way along with the stroke there.
+    quarter = table.positions((0.25,))[0]
+    k = count // 4
+    if np.linalg.norm(points_2d[reverse[k]] - quarter) < np.linalg.norm(points_2d[order[k]] - quarter):
+        return reverse
+    return order
+
+
+# Parameters (fractions of the stroke length) for the K points (K, D) of a chain, in order.
+# 'EVEN' spaces them evenly; 'PROPORTIONAL' keeps the chain's own spacing, relatively.
+# An open chain spans the whole stroke. A closed one goes round it, leaving the gap back
+# to its first element at the end.
+def spacing_parameters(points, closed, spacing='EVEN'):
+    points = np.asarray(points, dtype=np.float64)
+    count = len(points)
+    if count == 0:
+        return np.empty(0)
+
+    if spacing == 'PROPORTIONAL':
+        steps = np.linalg.norm(points[1:] - points[:-1], axis=1)
+        if closed:
+            steps = np.append(steps, np.linalg.norm(points[0] - points[-1]))
+        total = steps.sum()
+        if total > 0.0:
+            return np.concatenate(([0.0], np.cumsum(steps)))[:count] / total
+
+    if closed:
+        return np.arange(count) / count
+    if count == 1:
+        return np.zeros(1)
+    return np.linspace(0.0, 1.0, count)
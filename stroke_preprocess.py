@@ -0,0 +1,132 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Clean-up of screen-space strokes before they are indexed: simplification,
+# even resampling and smoothing. Distances are in region pixels.
+#
+# Like stroke_projection, this only depends on NumPy.
+
+import numpy as np
+
+
+class StrokeFilter:
+    """Preprocessing settings for a stroke. Zero turns a step off"""
+
+    def __init__(self, tolerance=0.0, spacing=0.0, smooth_iterations=0, max_points=0):
+        self.tolerance = float(tolerance)
+        self.spacing = float(spacing)
+        self.smooth_iterations = int(smooth_iterations)
+        self.max_points = int(max_points)
+
+    # Settings identifying this filter, for caching.
+    def key(self):
+        return (self.tolerance, self.spacing, self.smooth_iterations, self.max_points)
+
+    # Simplifies, resamples, then smooths a polyline (N, 2).
+    # The result never has more than max_points points (when set).
+    def apply(self, points_2d):
+        points_2d = simplify(points_2d, self.tolerance)
+        points_2d = resample(points_2d, self.spacing, self.max_points)
+        return smooth(points_2d, self.smooth_iterations)
+
+
+# Ramer-Douglas-Peucker: drops the points that are closer than tolerance to the
+# simplified polyline. The first and last point are always kept.
+def simplify(points_2d, tolerance):
+    points_2d = np.asarray(points_2d, dtype=np.float64).reshape(-1, 2)
+    count = len(points_2d)
+    if tolerance <= 0.0 or count < 3:
+        return points_2d
+
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # Spans still to be checked, as (first, last) indices. A stack instead of recursion,
+    # so long strokes can't hit the recursion limit.
+    spans = [(0, count - 1)]
+    while spans:
+        first, last = spans.pop()
+        if last - first < 2:
+            continue
+        distance = _distance_to_segment(points_2d[first + 1:last], points_2d[first], points_2d[last])
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            spans.append((first, split))
+            spans.append((split, last))
+
+    return points_2d[keep]
+
+
+# Resamples a polyline at even arc-length steps of about spacing, end points included.
+# With max_points set, the spacing is widened when needed to stay within that many points,
+# and a polyline that has too many points is resampled even when spacing is off.
+def resample(points_2d, spacing, max_points=0):
+    points_2d = np.asarray(points_2d, dtype=np.float64).reshape(-1, 2)
+    count = len(points_2d)
+    if count < 2:
+        return points_2d
+    # Nothing to resample: the polyline is left exactly as it is.
+    if spacing <= 0.0 and (max_points <= 1 or count <= max_points):
+        return points_2d
+
+    # Repeated points would make the arc length stall, which np.interp can't handle.
+    lengths = np.linalg.norm(np.diff(points_2d, axis=0), axis=1)
+    moving = np.concatenate(([True], lengths > 0.0))
+    points_2d = points_2d[moving]
+    distance = np.concatenate(([0.0], np.cumsum(lengths[lengths > 0.0])))
+    total = distance[-1]
+    if total == 0.0:
+        return points_2d[:1]
+
+    if spacing > 0.0:
+        target = int(np.ceil(total / spacing)) + 1
+    else:
+        target = len(points_2d)
+    if max_points > 1:
+        target = min(target, max_points)
+    if spacing <= 0.0 and target == len(points_2d):
+        return points_2d
+    target = max(target, 2)
+
+    steps = np.linspace(0.0, total, target)
+    return np.stack((np.interp(steps, distance, points_2d[:, 0]), np.interp(steps, distance, points_2d[:, 1])), axis=1)
+
+
+# Laplacian smoothing: each inner point moves factor of the way towards the midpoint
+# of its neighbours, iterations times. End points stay put.
+def smooth(points_2d, iterations, factor=0.5):
+    points_2d = np.array(points_2d, dtype=np.float64).reshape(-1, 2)
+    if len(points_2d) < 3:
+        return points_2d
+
+    for _ in range(max(int(iterations), 0)):
+        midpoints = (points_2d[:-2] + points_2d[2:]) * 0.5
+        points_2d[1:-1] += (midpoints - points_2d[1:-1]) * factor
+    return points_2d
+
+
+# Distance from each point (N, 2) to the segment from start to end.
+def _distance_to_segment(points, start, end):
+    direction = end - start
+    length2 = direction @ direction
+    if length2 == 0.0:
+        return np.linalg.norm(points - start, axis=1)
+    factor = np.clip(((points - start) @ direction) / length2, 0.0, 1.0)
+    return np.linalg.norm(points - (start + direction * factor[:, None]), axis=1)
@@ -0,0 +1,220 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Screen-space projection of points onto an annotation stroke.
+#
+# Nothing in here touches bpy: every function works on plain 2D coordinates
+# (tuples, mathutils vectors or NumPy arrays), so the module can be imported,
+# profiled and tested outside of Blender.
+
+import numpy as np
+
+
+# Vertices further away than this (along the search axis) from every stroke point land on (0, 0).
+MAX_SEARCH_DISTANCE = 9999.0
+
+# Number of vertices solved per NumPy pass. Bounds the size of the temporary arrays.
+DEFAULT_CHUNK_SIZE = 65536
+
+
+class StrokeIndex:
+    """Precomputed lookup data for one stroke, built once per operator run"""
+
+    def __init__(self, points_2d):
+        self.points = np.asarray(points_2d, dtype=np.float64).reshape(-1, 2)
+        if len(self.points) == 0:
+            raise ValueError("Stroke has no points")
+
+        self.bbox_min = self.points.min(axis=0)
+        self.bbox_max = self.points.max(axis=0)
+
+        # Search axis (a) and interpolated axis (b). Vertices look up or to the
+        # side along the stroke's longest bounding box side.
+        self.vertical = is_vertical(self.bbox_min, self.bbox_max)
+        self.axis = 1 if self.vertical else 0
+        self.cross_axis = 1 - self.axis
+
+        # A stable sort keeps equal coordinates in stroke order, so the first entry of a run
+        # of equal values is the lowest stroke index. Searching the sorted coordinates then
+        # picks the same point as walking the stroke and keeping the first closest one.
+        self.order = np.argsort(self.points[:, self.axis], kind='stable')
+        self.sorted_coords = self.points[self.order, self.axis]
+
+        # Segment table: neighbours of each point (clamped at the stroke ends),
+        # and the (start, end) pair of every segment along the stroke.
+        last = len(self.points) - 1
+        indices = np.arange(len(self.points))
+        self.previous_index = np.maximum(indices - 1, 0)
+        self.next_index = np.minimum(indices + 1, last)
+        self.segments = np.stack((self.points[:-1], self.points[1:]), axis=1)
+
+    def __len__(self):
+        return len(self.points)
+
+    # Index of, and distance along the search axis to, the nearest stroke point for each vertex.
+    def nearest_indices(self, vertices_2d):
+        vertices_2d = _as_points(vertices_2d)
+        last = len(self.points) - 1
+        x = vertices_2d[:, self.axis]
+
+        # Candidates: the first stroke point at or past the vertex, and the last one before it.
+        right = np.searchsorted(self.sorted_coords, x, side='left')
+        left = right - 1
+        has_right = right <= last
+        has_left = left >= 0
+
+        right = np.minimum(right, last)
+        left = np.maximum(left, 0)
+        # Jump to the start of the run of equal values for the left candidate.
+        left = np.searchsorted(self.sorted_coords, self.sorted_coords[left], side='left')
+
+        right_distance = np.where(has_right, np.abs(x - self.sorted_coords[right]), np.inf)
+        left_distance = np.where(has_left, np.abs(x - self.sorted_coords[left]), np.inf)
+        right_index = self.order[right]
+        left_index = self.order[left]
+
+        # Ties go to the lower stroke index.
+        pick_left = (left_distance < right_distance) | ((left_distance == right_distance) & (left_index < right_index))
+        nearest = np.where(pick_left, left_index, right_index)
+        distance = np.where(pick_left, left_distance, right_distance)
+        return nearest, distance
+
+    # The stroke points on either side of each vertex along the search axis.
+    # Returns (upper, lower), two (N, 2) arrays.
+    def closest_segments(self, vertices_2d, nearest=None):
+        vertices_2d = _as_points(vertices_2d)
+        if nearest is None:
+            nearest, _ = self.nearest_indices(vertices_2d)
+
+        a = self.axis
+        gpoint = self.points[nearest]
+        previous_point = self.points[self.previous_index[nearest]]
+        next_point = self.points[self.next_index[nearest]]
+
+        # If the nearest gpoint is ABOVE the current vertex, find the nearest point BELOW as well.
+        # If the lower point is actually above the vertex, we picked the wrong point and need to correct.
+        above = gpoint[:, a] >= vertices_2d[:, a]
+        lower_if_above = previous_point.copy()
+        wrong = (previous_point[:, a] > gpoint[:, a]) | np.all(gpoint == previous_point, axis=1)
+        lower_if_above[wrong] = next_point[wrong]
+
+        # The opposite of the previous lines.
+        upper_if_below = previous_point.copy()
+        wrong = (previous_point[:, a] <= gpoint[:, a]) | np.all(previous_point == gpoint, axis=1)
+        upper_if_below[wrong] = next_point[wrong]
+
+        upper = np.where(above[:, None], gpoint, upper_if_below)
+        lower = np.where(above[:, None], lower_if_above, gpoint)
+        return upper, lower
+
+    # Projects every vertex onto the stroke: finds the closest stroke points in one
+    # direction and the other, then interpolates the position between them.
+    def project(self, vertices_2d, chunk_size=DEFAULT_CHUNK_SIZE):
+        vertices_2d = _as_points(vertices_2d)
+        projected = np.empty_like(vertices_2d)
+
+        chunk_size = max(int(chunk_size), 1)
+        for start in range(0, len(vertices_2d), chunk_size):
+            chunk = vertices_2d[start:start + chunk_size]
+            if len(self.points) == 1:
+                projected[start:start + chunk_size] = self._project_single_point(chunk)
+            else:
+                projected[start:start + chunk_size] = self._project_chunk(chunk)
+
+        return projected
+
+    def _project_chunk(self, vertices_2d):
+        a = self.axis
+        b = self.cross_axis
+        x = vertices_2d[:, a]
+
+        nearest, distance = self.nearest_indices(vertices_2d)
+        upper, lower = self.closest_segments(vertices_2d, nearest)
+
+        coord_interpolated = map_range((upper[:, a], lower[:, a]), (upper[:, b], lower[:, b]), x)
+
+        projected = vertices_2d.copy()
+        projected[:, b] = coord_interpolated
+        projected[distance >= MAX_SEARCH_DISTANCE] = 0.0
+        return projected
+
+    def _project_single_point(self, vertices_2d):
+        # A single point has no extent, so the axis is picked per vertex: the
+        # vertex moves along the axis on which it is furthest from the point.
+        point = self.points[0]
+        offset = np.abs(point - vertices_2d)
+        vertical = offset[:, 0] > offset[:, 1]
+        distance = np.where(vertical, offset[:, 1], offset[:, 0])
+
+        projected = vertices_2d.copy()
+        projected[vertical, 0] = point[0]
+        projected[~vertical, 1] = point[1]
+        projected[distance >= MAX_SEARCH_DISTANCE] = 0.0
+        return projected
+
+
+# Accepts either a StrokeIndex or raw stroke points.
+def as_stroke_index(stroke):
+    if isinstance(stroke, StrokeIndex):
+        return stroke
+    return StrokeIndex(stroke)
+
+
+# Projects every vertex in vertices_2d (N, 2) onto the stroke (a StrokeIndex or (M, 2) points).
+# Returns an (N, 2) float array with the projected screen positions.
+def project_points(vertices_2d, stroke, chunk_size=DEFAULT_CHUNK_SIZE):
+    return as_stroke_index(stroke).project(vertices_2d, chunk_size)
+
+
+def get_nearest_interpolated_point_on_stroke(vertex_2d, stroke):
+    return tuple(as_stroke_index(stroke).project([vertex_2d])[0].tolist())
+
+
+def get_closest_segment(vertex_2d, stroke):
+    upper, lower = as_stroke_index(stroke).closest_segments([vertex_2d])
+    return (tuple(upper[0].tolist()), tuple(lower[0].tolist()))
+
+
+# Generic clamp function
+def clamp(a, b, v):
+    if (v <= a):
+        return a
+    elif (v >= b):
+        return b
+    else:
+        return v
+
+
+# Function for determining if a bounding box is taller than it is wide.
+# A square counts as horizontal.
+def is_vertical(bbox_min, bbox_max):
+    return bool(bbox_max[1] - bbox_min[1] > bbox_max[0] - bbox_min[0])
+
+
+# Generic map range function, works on scalars and arrays alike.
+# grabbed from here: www.rosettacode.org/wiki/Map_range
+def map_range(fromrange, torange, value):
+    (a1, a2), (b1, b2) = fromrange, torange
+    # WORKAROUND: If torange start and end is equal, division by zero occurs.
+    # A tiny amount is added to one of them to avoid a zero value here.
+    a2 = np.where(a1 == a2, a2 + 0.0001, a2)
+    return b1 + ((value - a1) * (b2 - b1) / (a2 - a1))
+
+
+def _as_points(points_2d):
+    return np.asarray(points_2d, dtype=np.float64).reshape(-1, 2)
@@ -0,0 +1,231 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Solving world positions against a stroke, with caches that survive redo.
+#
+# When the influence slider in the redo panel is dragged, Blender undoes the
+# last run and executes the operator again. The strokes (which may have been
+# cleared by then) are kept here under a key the operator stores in a hidden
+# property, and solved targets are kept per strokes, view and input positions,
+# so a redo only has to redo the final lerp.
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from . import profiling
+from . import segment_index
+from . import stroke_distribution
+from . import stroke_preprocess
+from . import stroke_projection
+
+# Number of stroke sets and solved batches kept around.
+CACHE_SIZE = 8
+
+_strokes = OrderedDict()
+_solved = OrderedDict()
+
+
+class StrokeSolver:
+    """Strokes (in world space) seen from one view, ready to solve positions against"""
+
+    def __init__(self, view, strokes_world, projection='AXIS', key="", stroke_filter=None):
+        self.view = view
+        self.strokes_world = [np.asarray(stroke, dtype=np.float64).reshape(-1, 3) for stroke in strokes_world]
+        self.projection = projection
+        self.stroke_filter = stroke_filter if stroke_filter is not None else stroke_preprocess.StrokeFilter()
+        self.key = key
+        self._polylines = None
+        self._stroke = None
+        self._segments = None
+        self._arc_lengths = None
+        self._arc_segments = None
+
+    # The strokes in screen space, cleaned up: a list of (N, 2) polylines.
+    @property
+    def polylines(self):
+        if self._polylines is None:
+            with profiling.stage("stroke to screen", sum(len(stroke) for stroke in self.strokes_world)):
+                self._polylines = []
+                for stroke_world in self.strokes_world:
+                    points_2d = self.view.to_region(stroke_world)
+                    # Stroke points behind the view can't be used.
+                    points_2d = points_2d[~np.isnan(points_2d).any(axis=1)]
+                    points_2d = self.stroke_filter.apply(points_2d)
+                    if len(points_2d) > 0:
+                        self._polylines.append(points_2d)
+        return self._polylines
+
+    # Screen-space lookup structure for the strokes, built on first use.
+    # Both kinds answer project(vertices_2d) with an (N, 2) array of positions on a stroke.
+    # Several strokes always go into one SegmentGrid (nearest point on any of them):
+    # the axis lookup only works along a single stroke.
+    @property
+    def stroke(self):
+        if self._stroke is None:
+            polylines = self.polylines
+            with profiling.stage("stroke index", sum(len(polyline) for polyline in polylines)):
+                if self.projection == 'NEAREST' or len(polylines) > 1:
+                    self._stroke = segment_index.SegmentGrid.from_polylines(polylines)
+                else:
+                    self._stroke = stroke_projection.StrokeIndex(polylines[0] if polylines else np.empty((0, 2)))
+        return self._stroke
+
+    # Unit direction (N, 2) of the stroke at region positions that lie on it (as returned by
+    # stroke.project), from the segment nearest to each. NaN where the stroke has no direction.
+    def tangents(self, region_points):
+        region_points = np.asarray(region_points, dtype=np.float64).reshape(-1, 2)
+        tangents = np.full_like(region_points, np.nan)
+        valid = ~np.isnan(region_points).any(axis=1)
+        if not valid.any() or not self.polylines:
+            return tangents
+
+        if self._segments is None:
+            if isinstance(self.stroke, segment_index.SegmentGrid):
+                self._segments = self.stroke
+            else:
+                self._segments = segment_index.SegmentGrid.from_polylines(self.polylines)
+
+        segment = self._segments.nearest(region_points[valid])[1]
+        direction = self._segments.ends[segment] - self._segments.starts[segment]
+        length = np.linalg.norm(direction, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tangents[valid] = np.where(length[:, None] > 0.0, direction / length[:, None], np.nan)
+        return tangents
+
+    # Finds new world positions for world_points (N, 3): each point is projected to the
+    # screen, moved onto the stroke there, and brought back to 3D at its original depth.
+    # Points that can't be placed on screen (behind a perspective view) come back as NaN.
+    def solve(self, world_points):
+        world_points = np.asarray(world_points, dtype=np.float64).reshape(-1, 3)
+
+        cache_key = None
+        if self.key:
+            cache_key = (self.key, self.projection, self.stroke_filter.key(), _digest(*self.view.key()), _digest(world_points))
+            newcoords = _get(_solved, cache_key)
+            if newcoords is not None:
+                with profiling.stage("cached solve", len(world_points)):
+                    return newcoords.copy()
+
+        # Nothing of the strokes is in front of the view: nothing can be placed.
+        if not self.polylines:
+            return np.full_like(world_points, np.nan)
+        with profiling.stage("to screen", len(world_points)):
+            points_2d = self.view.to_region(world_points)
+            visible = ~np.isnan(points_2d).any(axis=1)
+        stroke = self.stroke
+        with profiling.stage("project on stroke", int(visible.sum())):
+            targets_2d = stroke.project(points_2d[visible])
+        with profiling.stage("back to 3D", len(targets_2d)):
+            newcoords = np.full_like(world_points, np.nan)
+            newcoords[visible] = self.view.to_world(targets_2d, world_points[visible])
+
+        if cache_key is not None:
+            _put(_solved, cache_key, newcoords.copy())
+        return newcoords
+
+    # Arc length table of the stroke elements are distributed along: the last one.
+    @property
+    def arc_lengths(self):
+        if self._arc_lengths is None:
+            polylines = self.polylines
+            self._arc_lengths = stroke_distribution.ArcLengthTable(polylines[-1] if polylines else np.empty((0, 2)))
+        return self._arc_lengths
+
+    # Like solve, but chains of points (stroke_distribution.Chain, rows into world_points) are
+    # spread along the whole stroke in their order, with 'EVEN' or 'PROPORTIONAL' spacing,
+    # instead of each point going to its own nearest place. Points keep their depth.
+    # Points in no chain, and chains of a single point, are solved as usual.
+    def distribute(self, world_points, chains, spacing='EVEN'):
+        world_points = np.asarray(world_points, dtype=np.float64).reshape(-1, 3)
+        table = self.arc_lengths
+        newcoords = np.full_like(world_points, np.nan)
+        if len(table) == 0:
+            return newcoords
+
+        with profiling.stage("to screen", len(world_points)):
+            points_2d = self.view.to_region(world_points)
+            visible = ~np.isnan(points_2d).any(axis=1)
+
+        targets_2d = np.full_like(points_2d, np.nan)
+        placed = np.zeros(len(world_points), dtype=bool)
+        with profiling.stage("spread on stroke", sum(len(chain.rows) for chain in chains)):
+            for chain in chains:
+                rows = chain.rows[visible[chain.rows]]
+                if len(rows) < 2:
+                    continue
+                if chain.ordered:
+                    rows = rows[stroke_distribution.orient(points_2d[rows], chain.closed, table)]
+                else:
+                    if self._arc_segments is None:
+                        self._arc_segments = segment_index.SegmentGrid.from_polylines([table.points])
+                    _, segment, factor, _ = self._arc_segments.nearest(points_2d[rows])
+                    rows = rows[np.argsort(table.parameters(segment, factor), kind='stable')]
+                parameters = stroke_distribution.spacing_parameters(world_points[rows], chain.closed, spacing)
+                targets_2d[rows] = table.positions(parameters)
+                placed[rows] = True
+
+        with profiling.stage("back to 3D", int(placed.sum())):
+            newcoords[placed] = self.view.to_world(targets_2d[placed], world_points[placed])
+        rest = ~placed
+        if rest.any():
+            newcoords[rest] = self.solve(world_points[rest])
+        return newcoords
+
+
+# Keeps a copy of the world-space points of some strokes. Returns the key to load them with.
+def store_strokes(strokes_world):
+    strokes_world = [np.array(stroke, dtype=np.float64).reshape(-1, 3) for stroke in strokes_world]
+    key = _digest(*strokes_world)
+    _put(_strokes, key, strokes_world)
+    return key
+
+
+def load_strokes(key):
+    if not key:
+        return None
+    return _get(_strokes, key)
+
+
+def clear():
+    _strokes.clear()
+    _solved.clear()
+
+
+def _digest(*arrays):
+    h = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        h.update(str(array.shape).encode())
+        h.update(array.tobytes())
+    return h.hexdigest()
+
+
+def _get(cache, key):
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+
+def _put(cache, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
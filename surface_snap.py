@@ -0,0 +1,133 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Snapping aligned points onto the surface of other meshes (for retopo).
+#
+# Each target object gets a BVH tree of its evaluated mesh, in object space.
+# Trees are kept between runs and only dropped when the depsgraph reports a
+# geometry change on their object (see the handlers in __init__), so moving a
+# target doesn't rebuild anything. Rays are first tested against each target's
+# bounding box, so only targets some ray can hit get a tree, and only those
+# rays are cast.
+
+import bpy
+import numpy as np
+from mathutils.bvhtree import BVHTree
+
+# BVH trees by object name.
+_trees = {}
+
+
+# Visible mesh objects that can be snapped to: everything not being edited.
+def target_objects(context):
+    return [obj for obj in context.visible_objects if obj.type == 'MESH' and obj.mode != 'EDIT']
+
+
+def get_tree(obj, depsgraph):
+    tree = _trees.get(obj.name)
+    if tree is None:
+        tree = BVHTree.FromObject(obj, depsgraph)
+        _trees[obj.name] = tree
+    return tree
+
+
+# Casts a view ray through the screen position of each world point (N, 3) onto the
+# target objects, and returns the closest hits. Points that miss everything, or have
+# no screen position, are returned unchanged.
+def snap_points(context, view, world_points, objects=None):
+    world_points = np.array(world_points, dtype=np.float64).reshape(-1, 3)
+    if objects is None:
+        objects = target_objects(context)
+
+    points_2d = view.to_region(world_points)
+    valid = np.flatnonzero(~np.isnan(points_2d).any(axis=1) & ~np.isnan(world_points).any(axis=1))
+    if len(valid) == 0 or not objects:
+        return world_points
+
+    origins, directions = view.rays(points_2d[valid])
+    best_distance = np.full(len(valid), np.inf)
+    depsgraph = context.evaluated_depsgraph_get()
+
+    for obj in objects:
+        matrix = np.array(obj.matrix_world, dtype=np.float64)
+        if abs(np.linalg.det(matrix[:3, :3])) < 1e-12:
+            continue
+        inverse = np.linalg.inv(matrix)
+
+        # Rays go into object space once for the whole batch; only the casts are per point.
+        local_origins = origins @ inverse[:3, :3].T + inverse[:3, 3]
+        local_directions = directions @ inverse[:3, :3].T
+
+        bound_box = np.array(obj.evaluated_get(depsgraph).bound_box, dtype=np.float64).reshape(-1, 3)
+        rows = rays_hitting_box(local_origins, local_directions, bound_box.min(axis=0), bound_box.max(axis=0))
+        if len(rows) == 0:
+            continue
+        tree = get_tree(obj, depsgraph)
+
+        hit_rows = []
+        hit_locations = []
+        for row, origin, direction in zip(rows.tolist(), local_origins[rows].tolist(), local_directions[rows].tolist()):
+            location = tree.ray_cast(origin, direction)[0]
+            if location is not None:
+                hit_rows.append(row)
+                hit_locations.append(location)
+        if not hit_rows:
+            continue
+
+        hit_rows = np.array(hit_rows, dtype=np.intp)
+        hits = np.array(hit_locations, dtype=np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+        distance = np.linalg.norm(hits - origins[hit_rows], axis=1)
+        closer = distance < best_distance[hit_rows]
+        best_distance[hit_rows[closer]] = distance[closer]
+        world_points[valid[hit_rows[closer]]] = hits[closer]
+
+    return world_points
+
+
+# Rows of the rays (origins and directions, (N, 3)) that hit the box from box_min to box_max
+# in front of their origin (slab test). The box is padded a little, so rays along a flat
+# box's faces aren't lost to rounding.
+def rays_hitting_box(origins, directions, box_min, box_max):
+    padding = (box_max - box_min).max() * 1e-6 + 1e-9
+    box_min = box_min - padding
+    box_max = box_max + padding
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (box_min - origins) / directions
+        t2 = (box_max - origins) / directions
+    # Rays parallel to a slab hit it everywhere or nowhere, depending on where they start.
+    parallel = directions == 0.0
+    inside = (origins >= box_min) & (origins <= box_max)
+    near = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2)).max(axis=1)
+    far = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2)).min(axis=1)
+    return np.flatnonzero(far >= np.maximum(near, 0.0))
+
+
+def invalidate(obj_name=None):
+    if obj_name is None:
+        _trees.clear()
+    else:
+        _trees.pop(obj_name, None)
+
+
+# Drops the trees of the objects whose geometry changed in a depsgraph update.
+def invalidate_updated(depsgraph):
+    if not _trees:
+        return
+    for update in depsgraph.updates:
+        if update.is_updated_geometry and isinstance(update.id, bpy.types.Object):
+            invalidate(update.id.original.name)
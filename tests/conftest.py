@@ -0,0 +1,15 @@
+# The addon's __init__ needs bpy, but the modules tested here only need NumPy.
+# The repository is registered as a package whose __init__ is never run, so they
+# import (with their relative imports) as addon.<module>.
+
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if "addon" not in sys.modules:
+    spec = importlib.machinery.ModuleSpec("addon", None, is_package=True)
+    spec.submodule_search_locations = [ROOT]
+    sys.modules["addon"] = importlib.util.module_from_spec(spec)
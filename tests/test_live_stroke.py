@@ -0,0 +1,106 @@
+# Checks LiveStrokeIndex, through strokes that grow, change part way and start over,
+# against the nearest point on the current stroke found by checking every segment.
+
+import numpy as np
+import pytest
+
+from addon import live_stroke
+
+
+# Distance from every vertex (N, 2) to the nearest segment of the polyline (M, 2), and
+# the closest point on it.
+def brute_force(vertices, stroke):
+    if len(stroke) == 1:
+        stroke = np.concatenate((stroke, stroke))
+    starts, ends = stroke[:-1], stroke[1:]
+    direction = ends - starts
+    length2 = (direction * direction).sum(axis=1)
+    offset = vertices[:, None, :] - starts[None, :, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where(length2 > 0, (offset * direction).sum(axis=2) / length2, 0.0)
+    closest = starts + direction * np.clip(factor, 0.0, 1.0)[..., None]
+    distance = np.linalg.norm(vertices[:, None, :] - closest, axis=2)
+    segment = distance.argmin(axis=1)
+    rows = np.arange(len(vertices))
+    return distance[rows, segment], closest[rows, segment]
+
+
+def assert_solved(index, stroke):
+    visible = index.visible
+    assert len(index.pending()) == 0
+    distance, closest = brute_force(index.vertices[visible], stroke)
+    np.testing.assert_allclose(index.best_distance[visible], distance, rtol=1e-9, atol=1e-9)
+    # The segment found is one of the nearest, and the point is on it.
+    np.testing.assert_allclose(np.linalg.norm(index.closest[visible] - index.vertices[visible], axis=1), distance, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(index.closest[visible], closest, atol=1e-6)
+    assert np.isnan(index.closest[~visible]).all()
+
+
+def make_vertices(seed, count=700):
+    rng = np.random.default_rng(seed)
+    vertices = rng.uniform(0, 500, (count, 2))
+    # Off screen vertices are never solved.
+    vertices[:7] = np.nan
+    return vertices
+
+
+def make_stroke(seed, count=900):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.normal(size=(count, 2)) * 8.0, axis=0) + 250.0
+
+
+def solve_all(index, time_budget):
+    while len(index.pending()):
+        index.solve(time_budget=time_budget)
+
+
+@pytest.mark.parametrize("time_budget", (None, 0.0005))
+@pytest.mark.parametrize("block_size", (1, 16, 256))
+def test_growing_stroke(block_size, time_budget):
+    vertices = make_vertices(0)
+    stroke = make_stroke(1)
+    index = live_stroke.LiveStrokeIndex(vertices, block_size)
+    for count in (1, 2, 3, 50, 51, 300, 700, 900):
+        assert index.update(stroke[:count])
+        solve_all(index, time_budget)
+        assert_solved(index, stroke[:count])
+
+
+@pytest.mark.parametrize("block_size", (16, 256))
+def test_changed_and_shortened_stroke(block_size):
+    vertices = make_vertices(2)
+    stroke = make_stroke(3)
+    index = live_stroke.LiveStrokeIndex(vertices, block_size)
+    index.update(stroke)
+    index.solve()
+
+    # A change part way along, then the end taken off, then a new stroke altogether.
+    changed = stroke.copy()
+    changed[400:] += (6.0, -4.0)
+    for current in (changed, changed[:500], make_stroke(4, 300)):
+        assert index.update(current)
+        solve_all(index, 0.0005)
+        assert_solved(index, current)
+
+
+def test_unchanged_stroke():
+    index = live_stroke.LiveStrokeIndex(make_vertices(5), 32)
+    stroke = make_stroke(6, 100)
+    assert index.update(stroke)
+    index.solve()
+    assert not index.update(stroke.copy())
+    assert len(index.solve()) == 0
+
+
+# Solving part of the vertices, changing the stroke, then solving the rest.
+def test_stroke_changed_while_solving():
+    vertices = make_vertices(7, 5000)
+    stroke = make_stroke(8)
+    index = live_stroke.LiveStrokeIndex(vertices, 64)
+    index.update(stroke[:600])
+    index.solve(time_budget=0.0)
+    assert len(index.pending()) > 0
+
+    index.update(stroke)
+    index.solve()
+    assert_solved(index, stroke)
@@ -0,0 +1,52 @@
+# Checks build_mirror_map against comparing every vertex with every mirrored position.
+
+import numpy as np
+import pytest
+
+from addon import mirror
+
+
+# Nearest vertex to each mirrored position within epsilon (lowest index among equally
+# near ones), or -1.
+def brute_force(coords, epsilon=mirror.MIRROR_EPSILON):
+    mirrored = coords * np.array((-1.0, 1.0, 1.0))
+    distance = np.linalg.norm(coords[None, :, :] - mirrored[:, None, :], axis=2)
+    nearest = distance.argmin(axis=1)
+    return np.where(distance[np.arange(len(coords)), nearest] <= epsilon, nearest, -1)
+
+
+# One half of a mesh, its mirror image (off by up to about a tolerance), vertices on the
+# mirror plane, and overlapping vertices, shuffled.
+def make_mesh(seed, snap_to_cells):
+    rng = np.random.default_rng(seed)
+    half = rng.uniform(-0.01, 0.01, (1500, 3))
+    if snap_to_cells:
+        # Coordinates on the hash grid's cell sides.
+        cell = mirror.MIRROR_EPSILON * mirror._CELL_SCALE
+        half = np.round(half / cell) * cell
+    other = half * (-1.0, 1.0, 1.0) + rng.normal(0.0, mirror.MIRROR_EPSILON * 0.4, half.shape)
+    on_plane = half[:50] * (0.0, 1.0, 1.0)
+    coords = np.concatenate((half, other, half[:100], on_plane, np.zeros((20, 3)), -np.zeros((5, 3))))
+    return coords[rng.permutation(len(coords))]
+
+
+@pytest.mark.parametrize("snap_to_cells", (False, True))
+@pytest.mark.parametrize("seed", range(4))
+def test_build_mirror_map_matches_brute_force(seed, snap_to_cells):
+    coords = make_mesh(seed, snap_to_cells)
+    mirror_map = mirror.build_mirror_map(coords)
+    np.testing.assert_array_equal(mirror_map, brute_force(coords))
+    # Enough pairs are within tolerance for this to mean something.
+    assert (mirror_map >= 0).mean() > 0.5
+
+
+@pytest.mark.parametrize("epsilon", (1e-6, 1e-3))
+def test_epsilon(epsilon):
+    coords = make_mesh(9, False)
+    np.testing.assert_array_equal(mirror.build_mirror_map(coords, epsilon), brute_force(coords, epsilon))
+
+
+def test_small_cases():
+    assert len(mirror.build_mirror_map(np.zeros((0, 3)))) == 0
+    coords = np.array(((1.0, 0.0, 0.0), (-1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (2.0, 0.0, 0.0)))
+    np.testing.assert_array_equal(mirror.build_mirror_map(coords), (1, 0, 2, -1))
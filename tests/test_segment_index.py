@@ -0,0 +1,122 @@
+# Checks SegmentGrid.nearest against checking every segment of the stroke(s) one by one,
+# on both of its paths: the quadtree walk and the brute force one for short strokes.
+
+import numpy as np
+import pytest
+
+from addon import segment_index
+
+
+# Squared distance (N, M) from every point to every segment, and the closest points (N, M, 2).
+def brute_force(points, starts, ends):
+    direction = ends - starts
+    length2 = (direction * direction).sum(axis=1)
+    offset = points[:, None, :] - starts[None, :, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where(length2 > 0, (offset * direction).sum(axis=2) / length2, 0.0)
+    closest = starts + direction * np.clip(factor, 0.0, 1.0)[..., None]
+    delta = points[:, None, :] - closest
+    return (delta * delta).sum(axis=2), closest
+
+
+def segments_of(polylines):
+    starts = []
+    ends = []
+    for points in polylines:
+        if len(points) == 1:
+            points = np.concatenate((points, points))
+        starts.append(points[:-1])
+        ends.append(points[1:])
+    return np.concatenate(starts), np.concatenate(ends)
+
+
+def make_polylines(seed, sizes):
+    rng = np.random.default_rng(seed)
+    polylines = [np.cumsum(rng.normal(size=(size, 2)) * 15.0, axis=0) + rng.uniform(0, 400, 2) for size in sizes]
+    # A repeated point gives a zero-length segment.
+    if len(polylines[0]) > 4:
+        polylines[0][3] = polylines[0][2]
+    return polylines
+
+
+# The returned segment is one of the nearest (several can be, where segments meet),
+# and the returned point and distance are those of that segment.
+def assert_nearest(grid, polylines, queries, max_distance=None):
+    starts, ends = segments_of(polylines)
+    d2, closest = brute_force(queries, starts, ends)
+    best = np.sqrt(d2.min(axis=1))
+
+    points, segment, _, distance = grid.nearest(queries, chunk_size=97, max_distance=max_distance)
+
+    bound = np.inf if max_distance is None else np.broadcast_to(max_distance, best.shape)
+    found = best <= bound * (1.0 - 1e-9)
+    missed = best > bound * (1.0 + 1e-9)
+    assert (segment[found] >= 0).all()
+    assert (segment[missed] == -1).all()
+    assert np.isnan(points[missed]).all() and np.isinf(distance[missed]).all()
+
+    rows = np.flatnonzero(found)
+    np.testing.assert_allclose(distance[rows], best[rows], rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(np.sqrt(d2[rows, segment[rows]]), best[rows], rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(points[rows], closest[rows, segment[rows]], rtol=1e-9, atol=1e-9)
+
+
+@pytest.fixture(params=("grid", "brute_force"))
+def path(request, monkeypatch):
+    if request.param == "grid":
+        monkeypatch.setattr(segment_index, "BRUTE_FORCE_SEGMENTS", 0)
+    else:
+        monkeypatch.setattr(segment_index, "BRUTE_FORCE_SEGMENTS", 10 ** 9)
+    return request.param
+
+
+@pytest.mark.parametrize("sizes", ((1,), (2,), (12,), (300,), (40, 1, 25, 300)))
+@pytest.mark.parametrize("seed", range(3))
+def test_nearest_matches_brute_force(path, seed, sizes):
+    polylines = make_polylines(seed, sizes)
+    grid = segment_index.SegmentGrid.from_polylines(polylines)
+    queries = np.random.default_rng(seed + 100).uniform(-200, 700, (600, 2))
+    assert_nearest(grid, polylines, queries)
+
+
+# Queries on a grid sit exactly on cell sides and stroke points, where pruning is tightest.
+def test_nearest_on_cell_boundaries(path):
+    rng = np.random.default_rng(7)
+    polylines = [rng.integers(0, 20, (60, 2)).astype(np.float64) * 8.0]
+    grid = segment_index.SegmentGrid.from_polylines(polylines)
+    queries = np.stack(np.meshgrid(np.arange(-2, 22) * 8.0, np.arange(-2, 22) * 8.0), axis=-1).reshape(-1, 2)
+    assert_nearest(grid, polylines, queries)
+
+
+@pytest.mark.parametrize("per_query", (False, True))
+def test_max_distance(path, per_query):
+    polylines = make_polylines(4, (150,))
+    grid = segment_index.SegmentGrid.from_polylines(polylines)
+    rng = np.random.default_rng(5)
+    queries = rng.uniform(-200, 700, (600, 2))
+    max_distance = rng.uniform(0, 150, len(queries)) if per_query else 40.0
+    assert_nearest(grid, polylines, queries, max_distance)
+
+
+def test_segments_never_bridge_polylines(path):
+    polylines = [np.array(((0.0, 0.0), (10.0, 0.0))), np.array(((10.0, 10.0), (20.0, 10.0)))]
+    grid = segment_index.SegmentGrid.from_polylines(polylines)
+    # Nearest to the gap between the end of one and the start of the other.
+    _, segment, _, distance = grid.nearest([(10.0, 5.0)])
+    assert segment[0] == 0
+    assert distance[0] == pytest.approx(5.0)
+
+
+def test_both_paths_agree(monkeypatch):
+    polylines = make_polylines(9, (120, 3))
+    grid = segment_index.SegmentGrid.from_polylines(polylines)
+    queries = np.random.default_rng(10).uniform(-200, 700, (2000, 2))
+    max_distance = np.random.default_rng(11).uniform(0, 200, len(queries))
+
+    results = []
+    for threshold in (0, 10 ** 9):
+        monkeypatch.setattr(segment_index, "BRUTE_FORCE_SEGMENTS", threshold)
+        results.append(grid.nearest(queries, max_distance=max_distance))
+
+    for grid_result, brute_force_result in zip(*results):
+        np.testing.assert_array_equal(grid_result, brute_force_result)
@@ -0,0 +1,124 @@
+# Checks that the vectorized project_points gives the same results as the per-vertex
+# search it replaced (copied below as it was before the solver was vectorized).
+#
+# stroke_projection only needs NumPy, so this runs with plain pytest:
+#   python -m pytest tests
+
+import numpy as np
+import pytest
+
+from addon import stroke_projection
+
+
+# The old per-vertex loop, kept as the reference.
+def legacy_nearest_interpolated_point_on_stroke(vertex_2d, points_2d):
+    if legacy_is_vertical(vertex_2d, points_2d):
+        a = 1
+        b = 0
+    if not legacy_is_vertical(vertex_2d, points_2d):
+        a = 0
+        b = 1
+
+    nearest_distance = 9999.0
+    nearest_point = (0, 0)
+    point_upper = 0.0
+    point_lower = 0.0
+    coord_interpolated = 0
+
+    for i, gpoint_2d in enumerate(points_2d):
+        previous_point = legacy_clamp(0, len(points_2d)-1, i - 1)
+        next_point = legacy_clamp(0, len(points_2d)-1, i + 1)
+
+        distance = abs(vertex_2d[a] - gpoint_2d[a])
+
+        if (distance < nearest_distance):
+            nearest_distance = distance
+            if (gpoint_2d[a] >= vertex_2d[a]):
+                point_upper = gpoint_2d
+                point_lower = points_2d[previous_point]
+                if (point_lower[a] > point_upper[a]) or (point_upper == point_lower):
+                    point_lower = points_2d[next_point]
+            else:
+                point_lower = gpoint_2d
+                point_upper = points_2d[previous_point]
+                if (point_upper[a] <= point_lower[a]) or (point_upper == point_lower):
+                    point_upper = points_2d[next_point]
+
+            hrange = (point_upper[b], point_lower[b])
+            vrange = (point_upper[a], point_lower[a])
+            coord_interpolated = legacy_map_range(vrange, hrange, vertex_2d[a])
+
+            if a == 1:
+                nearest_point = (coord_interpolated, vertex_2d[1])
+            if a == 0:
+                nearest_point = (vertex_2d[0], coord_interpolated)
+
+    return nearest_point
+
+
+def legacy_clamp(a, b, v):
+    if (v <= a):
+        return a
+    elif (v >= b):
+        return b
+    else:
+        return v
+
+
+def legacy_is_vertical(vertex, list_of_vec2):
+    if len(list_of_vec2) == 1:
+        if abs(list_of_vec2[0][0] - vertex[0]) > abs(list_of_vec2[0][1] - vertex[1]):
+            return True
+        else:
+            return False
+
+    minval = list(map(min, *list_of_vec2))
+    maxval = list(map(max, *list_of_vec2))
+
+    if (maxval[0] - minval[0] > maxval[1] - minval[1]):
+        return False
+    if (maxval[0] - minval[0] < maxval[1] - minval[1]):
+        return True
+
+
+def legacy_map_range(fromrange, torange, value):
+    (a1, a2), (b1, b2) = fromrange, torange
+    if (a1 == a2):
+        a2 += 0.0001
+    return b1 + ((value - a1) * (b2 - b1) / (a2 - a1))
+
+
+def legacy_project_points(vertices_2d, points_2d):
+    points_2d = [tuple(p) for p in np.asarray(points_2d, dtype=np.float64).tolist()]
+    return np.array([legacy_nearest_interpolated_point_on_stroke(tuple(v), points_2d)
+                     for v in np.asarray(vertices_2d, dtype=np.float64).tolist()], dtype=np.float64).reshape(-1, 2)
+
+
+# Random strokes and vertices. Coordinates on a coarse grid give plenty of ties, repeated
+# stroke points and square bounding boxes; the far vertices hit the 9999 cut-off.
+def make_case(seed, stroke_size, vertex_count, grid):
+    rng = np.random.default_rng(seed)
+    if grid:
+        stroke = rng.integers(0, 8, (stroke_size, 2)).astype(np.float64) * 10.0
+        vertices = rng.integers(-2, 10, (vertex_count, 2)).astype(np.float64) * 10.0
+    else:
+        stroke = np.cumsum(rng.normal(size=(stroke_size, 2)) * 20.0, axis=0) + rng.uniform(0, 500, 2)
+        vertices = rng.uniform(-100, 700, (vertex_count, 2))
+    vertices[:3] += (20000.0, -15000.0)
+    return stroke, vertices
+
+
+@pytest.mark.parametrize("grid", (False, True))
+@pytest.mark.parametrize("stroke_size", (1, 2, 3, 17, 200))
+@pytest.mark.parametrize("seed", range(5))
+def test_project_points_matches_legacy_loop(seed, stroke_size, grid):
+    stroke, vertices = make_case(seed, stroke_size, 300, grid)
+    expected = legacy_project_points(vertices, stroke)
+    np.testing.assert_array_equal(stroke_projection.project_points(vertices, stroke), expected)
+
+
+def test_chunk_size_does_not_change_results():
+    stroke, vertices = make_case(0, 50, 1000, False)
+    expected = stroke_projection.project_points(vertices, stroke)
+    for chunk_size in (1, 7, 999):
+        np.testing.assert_array_equal(stroke_projection.project_points(vertices, stroke, chunk_size), expected)
@@ -0,0 +1,48 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Batched local <-> world conversion of coordinate arrays. Only depends on NumPy.
+
+import numpy as np
+
+
+class ObjectTransform:
+    """World matrix of an object and its inverse, computed once"""
+
+    def __init__(self, matrix_world):
+        self.matrix = np.array(matrix_world, dtype=np.float64).reshape(4, 4)
+        self.inverse = np.linalg.inv(self.matrix)
+
+    # Local positions (N, 3) to world positions (N, 3).
+    def to_world(self, local_points):
+        return _apply(self.matrix, local_points)
+
+    # World positions (N, 3) to local positions (N, 3).
+    def to_local(self, world_points):
+        return _apply(self.inverse, world_points)
+
+
+# Linear interpolation between two coordinate arrays, like mathutils.Vector.lerp.
+def lerp(start, end, factor):
+    start = np.asarray(start, dtype=np.float64)
+    return start + (np.asarray(end, dtype=np.float64) - start) * factor
+
+
+def _apply(matrix, points):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
@@ -0,0 +1,160 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Batched conversions between world space and 3D viewport region (screen) space.
+#
+# Same maths as bpy_extras.view3d_utils.location_3d_to_region_2d and
+# region_2d_to_location_3d, but for whole arrays of points at once. The view is
+# captured once, so nothing in here reads bpy.context.
+#
+# UVProjection does the same for the UV Editor, where "world" space is UV space.
+
+import numpy as np
+
+
+class ViewProjection:
+    """Snapshot of a 3D viewport region's projection"""
+
+    def __init__(self, width, height, perspective_matrix, view_matrix, is_perspective):
+        self.width = float(width)
+        self.height = float(height)
+        self.perspective_matrix = np.array(perspective_matrix, dtype=np.float64).reshape(4, 4)
+        self.perspective_inverse = np.linalg.inv(self.perspective_matrix)
+        self.view_inverse = np.linalg.inv(np.array(view_matrix, dtype=np.float64).reshape(4, 4))
+        self.is_perspective = bool(is_perspective)
+
+    @classmethod
+    def from_region(cls, region, region_3d):
+        return cls(region.width, region.height, region_3d.perspective_matrix, region_3d.view_matrix, region_3d.is_perspective)
+
+    @classmethod
+    def from_context(cls, context):
+        return cls.from_region(context.region, context.space_data.region_3d)
+
+    # Arrays identifying this view, for caching.
+    def key(self):
+        return (np.array((self.width, self.height, float(self.is_perspective))), self.perspective_matrix, self.view_inverse)
+
+    # World positions (N, 3) to region pixel positions (N, 2).
+    # Points behind a perspective view have no screen position and come back as NaN.
+    def to_region(self, world_points):
+        world_points = np.asarray(world_points, dtype=np.float64).reshape(-1, 3)
+        prj = world_points @ self.perspective_matrix[:, :3].T + self.perspective_matrix[:, 3]
+
+        width_half = self.width / 2.0
+        height_half = self.height / 2.0
+        w = prj[:, 3]
+        visible = w > 0.0
+        safe_w = np.where(visible, w, 1.0)
+
+        region_points = np.empty((len(world_points), 2))
+        region_points[:, 0] = width_half + width_half * (prj[:, 0] / safe_w)
+        region_points[:, 1] = height_half + height_half * (prj[:, 1] / safe_w)
+        region_points[~visible] = np.nan
+        return region_points
+
+    # View rays through region pixel positions (N, 2), like view3d_utils.region_2d_to_origin_3d
+    # and region_2d_to_vector_3d. Returns (origins (N, 3), unit directions (N, 3)).
+    def rays(self, region_points):
+        region_points = np.asarray(region_points, dtype=np.float64).reshape(-1, 2)
+        dx = (2.0 * region_points[:, 0] / self.width) - 1.0
+        dy = (2.0 * region_points[:, 1] / self.height) - 1.0
+        persinv = self.perspective_inverse
+
+        if self.is_perspective:
+            out = np.stack((dx, dy, np.full_like(dx, -0.5)), axis=1)
+            w = out @ persinv[3, :3] + persinv[3, 3]
+            direction = (out @ persinv[:3, :3].T + persinv[:3, 3]) / w[:, None] - self.view_inverse[:3, 3]
+            direction /= np.linalg.norm(direction, axis=1)[:, None]
+            return np.broadcast_to(self.view_inverse[:3, 3], direction.shape).copy(), direction
+
+        # Orthographic: parallel rays along the view axis, starting on the near clip plane.
+        origin = dx[:, None] * persinv[:3, 0] + dy[:, None] * persinv[:3, 1] + persinv[:3, 3] - persinv[:3, 2]
+        view_axis = self.view_inverse[:3, 2]
+        direction = np.broadcast_to(-view_axis / np.linalg.norm(view_axis), origin.shape).copy()
+        return origin, direction
+
+    # Region pixel positions (N, 2) back to world positions (N, 3), each placed at
+    # the depth of the matching depth_points (N, 3) world position.
+    def to_world(self, region_points, depth_points):
+        region_points = np.asarray(region_points, dtype=np.float64).reshape(-1, 2)
+        depth_points = np.asarray(depth_points, dtype=np.float64).reshape(-1, 3)
+
+        dx = (2.0 * region_points[:, 0] / self.width) - 1.0
+        dy = (2.0 * region_points[:, 1] / self.height) - 1.0
+        persinv = self.perspective_inverse
+        view_axis = self.view_inverse[:3, 2]
+
+        if self.is_perspective:
+            # Ray from the view origin through each pixel, intersected with the
+            # view-aligned plane through the depth point.
+            _, direction = self.rays(region_points)
+            origin = self.view_inverse[:3, 3]
+            facing = direction @ view_axis
+            with np.errstate(divide='ignore', invalid='ignore'):
+                factor = ((depth_points - origin) @ view_axis) / facing
+            factor[np.abs(facing) < 1e-6] = np.nan
+            return origin + direction * factor[:, None]
+
+        # Orthographic: parallel rays along the view axis, closest point to the depth point.
+        direction = -view_axis
+        origin = dx[:, None] * persinv[:3, 0] + dy[:, None] * persinv[:3, 1] + persinv[:3, 3]
+        factor = ((depth_points - origin) @ direction) / (direction @ direction)
+        return origin + direction * factor[:, None]
+
+
+class UVProjection:
+    """Snapshot of a UV Editor region's view of UV space"""
+
+    def __init__(self, width, height, view_origin, view_scale):
+        self.width = float(width)
+        self.height = float(height)
+        self.view_origin = np.array(view_origin, dtype=np.float64).reshape(2)
+        self.view_scale = np.array(view_scale, dtype=np.float64).reshape(2)
+
+    # The UV Editor's View2D maps region pixels to UV space with an offset and a scale,
+    # read here from two corners instead of converting every point through it.
+    @classmethod
+    def from_region(cls, region):
+        view2d = region.view2d
+        x0, y0 = view2d.region_to_view(0.0, 0.0)
+        x1, y1 = view2d.region_to_view(float(region.width), float(region.height))
+        return cls(region.width, region.height, (x0, y0), (region.width / (x1 - x0), region.height / (y1 - y0)))
+
+    @classmethod
+    def from_context(cls, context):
+        return cls.from_region(context.region)
+
+    # Arrays identifying this view, for caching.
+    def key(self):
+        return (np.array((self.width, self.height)), self.view_origin, self.view_scale)
+
+    # UVs, as (N, 3) points with a zero third component, to region pixel positions (N, 2).
+    def to_region(self, uv_points):
+        uv_points = np.asarray(uv_points, dtype=np.float64).reshape(-1, 3)
+        return (uv_points[:, :2] - self.view_origin) * self.view_scale
+
+    # Region pixel positions (N, 2) back to UVs (N, 3). The third component is taken
+    # from depth_points, to match ViewProjection.to_world.
+    def to_world(self, region_points, depth_points):
+        region_points = np.asarray(region_points, dtype=np.float64).reshape(-1, 2)
+        depth_points = np.asarray(depth_points, dtype=np.float64).reshape(-1, 3)
+        uv_points = np.empty((len(region_points), 3))
+        uv_points[:, :2] = region_points / self.view_scale + self.view_origin
+        uv_points[:, 2] = depth_points[:, 2]
+        return uv_points